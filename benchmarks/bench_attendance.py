@@ -0,0 +1,286 @@
+"""Reproducible benchmark for the attendance registration hot path.
+
+    python -m benchmarks.bench_attendance [--corpus DIR] [--iterations 50]
+        [--workers 2] [--output run.json] [--compare baseline.json]
+
+Stages measured:
+  preprocess   core.face._preprocess_image_fast per resolution
+  face         core.face.extract_face_encoding per resolution and pipeline
+  haversine    the original scalar haversine geofence check
+  flow         core.reg_attendance.register_attendance end to end against a
+               seeded throwaway SQLite database; --database-url points it at
+               another database instead, whose tables are DROPPED and
+               re-created, so it also needs --i-know-this-drops-tables
+
+Without --corpus a fixed synthetic corpus is generated from --seed at several
+resolutions. Synthetic images contain no real face, so the face and flow
+stages then measure the decode/detect/reject path only; point --corpus at a
+folder of single-face photos to include encoding and matching.
+
+Results are written as JSON so two commits can be compared with --compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from math import radians, cos, sin, asin, sqrt
+from pathlib import Path
+import numpy as np
+import cv2
+
+RESOLUTIONS = ((640, 480), (1280, 960), (1920, 1440), (4032, 3024))
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def _latency_stats(samples_s, workers: int = 1) -> dict:
+    ms = np.array(samples_s) * 1000
+    total = float(np.sum(samples_s))
+    return {
+        "n": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "ops_per_sec_per_core": round(len(ms) / total / workers, 2) if total else None,
+    }
+
+
+def _timeit(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def synthetic_corpus(seed: int) -> dict:
+    """Deterministic JPEGs: smooth gradients plus noise, one per resolution"""
+    rng = np.random.default_rng(seed)
+    corpus = {}
+    for width, height in RESOLUTIONS:
+        y, x = np.mgrid[0:height, 0:width]
+        base = ((x / width) * 180 + (y / height) * 60).astype(np.uint8)
+        image = np.dstack([base, np.flipud(base), np.fliplr(base)])
+        image = cv2.add(image, rng.integers(0, 40, image.shape, dtype=np.uint8))
+        cv2.ellipse(image, (width // 2, height // 2), (width // 8, height // 5), 0, 0, 360, (180, 160, 150), -1)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        corpus[f"synthetic_{width}x{height}"] = encoded.tobytes()
+    return corpus
+
+
+def load_corpus(path: Path) -> dict:
+    return {
+        p.name: p.read_bytes()
+        for p in sorted(path.iterdir())
+        if p.suffix.lower() in IMAGE_SUFFIXES
+    }
+
+
+def bench_preprocess(corpus: dict, iterations: int) -> dict:
+    from core.face import _preprocess_image_fast
+    return {
+        name: _latency_stats(_timeit(lambda: _preprocess_image_fast(data), iterations))
+        for name, data in corpus.items()
+    }
+
+
+def bench_face(corpus: dict, iterations: int) -> dict:
+    from core.face import extract_face_encoding
+    results = {}
+    for pipeline in ("full", "two_stage"):
+        for name, data in corpus.items():
+            _, error = extract_face_encoding(data, pipeline=pipeline)
+            stats = _latency_stats(_timeit(lambda: extract_face_encoding(data, pipeline=pipeline), iterations))
+            stats["face_detected"] = error is None
+            results[f"{pipeline}/{name}"] = stats
+    return results
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """The original per-request geofence distance, kept as the baseline"""
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    c = 2 * asin(sqrt(a))
+    r = 6371000
+    return c * r
+
+
+def bench_haversine(iterations: int) -> dict:
+    rng = np.random.default_rng(0)
+    points = rng.uniform([12.8, 80.0, 12.8, 80.0], [12.9, 80.1, 12.9, 80.1], size=(iterations, 4)).tolist()
+    samples = []
+    for lat1, lon1, lat2, lon2 in points:
+        start = time.perf_counter()
+        haversine(lon1, lat1, lon2, lat2)
+        samples.append(time.perf_counter() - start)
+    return _latency_stats(samples)
+
+
+def _seed_database(corpus: dict, students: int, seed: int) -> list:
+    """Create the schema and one open session with `students` enrolled"""
+    from utils.db import Database
+    from utils.embeddings import encode_embedding
+    from core.face import extract_face_encoding
+    from models import (Base, User, UserRole, Course, StudentCourseEnrollment, AttendanceSession)
+
+    Database.initialize()
+    Base.metadata.drop_all(Database._engine)
+    Base.metadata.create_all(Database._engine)
+
+    rng = np.random.default_rng(seed)
+    images = list(corpus.values())
+    reference = {}
+    for i, data in enumerate(images):
+        encoding, error = extract_face_encoding(data)
+        reference[i] = encoding if error is None else rng.normal(0, 0.1, 128)
+
+    with Database.get_session() as session:
+        course = Course(course_name="Benchmark", course_code="BENCH101", credits=3)
+        session.add(course)
+        session.add(User(
+            reg_no="FAC0001", name="Faculty", parent_email="fac@example.com",
+            password_hash="x", role=UserRole.faculty, face=encode_embedding(np.zeros(128)),
+        ))
+        session.flush()
+        submissions = []
+        for i in range(students):
+            reg_no = f"STU{i:05d}"
+            image_index = i % len(images)
+            session.add(User(
+                reg_no=reg_no, name=f"Student {i}", parent_email=f"{reg_no}@example.com",
+                password_hash="x", role=UserRole.student, face=encode_embedding(reference[image_index]),
+            ))
+            session.add(StudentCourseEnrollment(student_id=reg_no, course_id=course.id))
+            submissions.append((reg_no, images[image_index]))
+        session.add(AttendanceSession(
+            course_id=course.id, faculty_id="FAC0001", start_time=datetime.now(),
+            lat=12.8231, long=80.0442, radius_meters=50, is_active=True,
+        ))
+        session.commit()
+    return submissions
+
+
+def bench_flow(corpus: dict, students: int, workers: int, seed: int) -> dict:
+    from core.reg_attendance import register_attendance
+    from utils.face_pool import FacePool
+
+    submissions = _seed_database(corpus, students, seed)
+    os.environ["FACE_WORKERS"] = str(workers)
+    FacePool.initialize()
+
+    async def one(reg_no, data):
+        start = time.perf_counter()
+        ok, message = await register_attendance(reg_no, data, 12.8231, 80.0442)
+        return time.perf_counter() - start, ok, message
+
+    async def run():
+        # Warm the pool and session caches outside the measured window.
+        await asyncio.gather(*(FacePool.submit(len, b"") for _ in range(workers)))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(reg_no, data) for reg_no, data in submissions))
+        return time.perf_counter() - start, results
+
+    try:
+        wall, results = asyncio.run(run())
+    finally:
+        FacePool.shutdown()
+
+    outcomes = {}
+    for _, ok, message in results:
+        key = "success" if ok else message.split(".")[0]
+        outcomes[key] = outcomes.get(key, 0) + 1
+    stats = _latency_stats([r[0] for r in results], workers)
+    stats["ops_per_sec_per_core"] = round(len(results) / wall / workers, 2)
+    stats["workers"] = workers
+    stats["outcomes"] = outcomes
+    return stats
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2**20, 1),
+    }
+
+
+def compare(current: dict, baseline: dict, prefix: str = ""):
+    """Print p50/p95 deltas for every benchmark present in both runs"""
+    for key, value in current.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        if not isinstance(value, dict) or not isinstance(other, dict):
+            continue
+        if "p50_ms" in value and "p50_ms" in other:
+            deltas = [
+                f"{metric} {other[metric]:.2f} -> {value[metric]:.2f} ({(value[metric] - other[metric]) / other[metric] * 100:+.1f}%)"
+                for metric in ("p50_ms", "p95_ms")
+                if other.get(metric)
+            ]
+            print(f"{prefix}{key}: " + ", ".join(deltas))
+        else:
+            compare(value, other, f"{prefix}{key}/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--students", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file; its tables are dropped")
+    parser.add_argument("--i-know-this-drops-tables", dest="allow_drop", action="store_true",
+                        help="required with --database-url")
+    parser.add_argument("--skip", action="append", default=[], choices=["preprocess", "face", "haversine", "flow"])
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+    if args.database_url and "flow" not in args.skip and not args.allow_drop:
+        parser.error("the flow benchmark drops every table in --database-url; "
+                     "pass --i-know-this-drops-tables if that database is disposable")
+
+    workdir = tempfile.mkdtemp(prefix="monitor-bench-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{workdir}/bench.db"
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.seed)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "corpus": str(args.corpus) if args.corpus else "synthetic",
+        }
+    }
+    if "preprocess" not in args.skip:
+        report["preprocess"] = bench_preprocess(corpus, args.iterations)
+    if "face" not in args.skip:
+        report["face"] = bench_face(corpus, max(1, args.iterations // 5))
+    if "haversine" not in args.skip:
+        report["haversine"] = bench_haversine(args.iterations * 100)
+    if "flow" not in args.skip:
+        report["flow"] = bench_flow(corpus, args.students, args.workers, args.seed)
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
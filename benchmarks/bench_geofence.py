@@ -0,0 +1,88 @@
+"""Benchmark for core.geofence against the old scalar haversine check.
+
+    python -m benchmarks.bench_geofence [--points 100000] [--iterations 2000]
+        [--output run.json] [--compare baseline.json]
+
+Stages measured:
+  haversine     the original scalar haversine check, one point at a time
+  check         Fence.check, one point at a time (circle and polygon)
+
+Points are drawn from --seed around the fence so roughly half are inside.
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from benchmarks.bench_attendance import _latency_stats, _timeit, compare, haversine
+from core.geofence import Fence
+
+CENTRE = (12.8231, 80.0442)
+RADIUS_M = 30
+
+
+def _polygon(vertices: int) -> list:
+    """Regular polygon of about the circle's size"""
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    lat, lon = CENTRE
+    return [
+        [lat + RADIUS_M * np.sin(a) / 111195, lon + RADIUS_M * np.cos(a) / (111195 * np.cos(np.radians(lat)))]
+        for a in angles
+    ]
+
+
+def _points(n: int, seed: int):
+    rng = np.random.default_rng(seed)
+    spread = 1.25 * RADIUS_M / 111195  # square of side 2.5r: about half inside the circle
+    return CENTRE[0] + rng.uniform(-spread, spread, n), CENTRE[1] + rng.uniform(-spread, spread, n)
+
+
+def bench_scalar(fn, lats, lons, iterations: int) -> dict:
+    points = iter(zip(np.resize(lats, iterations).tolist(), np.resize(lons, iterations).tolist()))
+    return _latency_stats(_timeit(lambda: fn(*next(points)), iterations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--vertices", type=int, default=12)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+
+    lats, lons = _points(args.points, args.seed)
+    circle = Fence(*CENTRE, RADIUS_M)
+    polygon = Fence(*CENTRE, polygon=_polygon(args.vertices))
+
+    start = time.perf_counter()
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "seed": args.seed,
+            "points": args.points,
+            "vertices": args.vertices,
+        },
+        "haversine": bench_scalar(
+            lambda lat, lon: haversine(lon, lat, CENTRE[1], CENTRE[0]) <= RADIUS_M, lats, lons, args.iterations
+        ),
+        "check": {
+            "circle": bench_scalar(circle.check, lats, lons, args.iterations),
+            "polygon": bench_scalar(polygon.check, lats, lons, args.iterations),
+        },
+    }
+    report["meta"]["elapsed_s"] = round(time.perf_counter() - start, 2)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
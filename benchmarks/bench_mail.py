@@ -0,0 +1,166 @@
+"""Throughput benchmark for utils.mail.SMTPPool against a local SMTP sink.
+
+    python -m benchmarks.bench_mail [--messages 200] [--handshake-ms 150]
+        [--message-ms 5] [--output run.json] [--compare baseline.json]
+
+The sink is a minimal in-process SMTP server. --handshake-ms delays its
+greeting to stand in for the TCP + TLS + AUTH round trips of a real
+provider, which is exactly the cost pooling avoids.
+
+Scenarios:
+  fresh            one connection per message (the old per-email SMTP_SSL login)
+  pooled_N         N persistent connections, no rate limit
+  rate_limited     pooled_2 capped at --rate messages/sec
+  reconnect        pooled_2 against a sink that drops every connection after
+                   --drop-every messages; every message must still arrive
+"""
+import argparse
+import json
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.mime.text import MIMEText
+from pathlib import Path
+from benchmarks.bench_attendance import _latency_stats, compare
+from utils.mail import SMTPPool
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        sink = self.server
+        time.sleep(sink.handshake_s)
+        self._reply("220 sink ready")
+        served = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250 sink")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 end with .")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                time.sleep(sink.message_s)
+                with sink.lock:
+                    sink.delivered += 1
+                served += 1
+                self._reply("250 queued")
+                if sink.drop_every and served >= sink.drop_every:
+                    return  # hang up without QUIT, like an idle-timeout on the provider side
+            elif command == "QUIT":
+                self._reply("221 bye")
+                return
+            else:
+                self._reply("502 not implemented")
+
+    def _reply(self, text: str):
+        self.wfile.write(f"{text}\r\n".encode("ascii"))
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_s: float, message_s: float, drop_every: int = 0):
+        super().__init__(("127.0.0.1", 0), _SinkHandler)
+        self.handshake_s = handshake_s
+        self.message_s = message_s
+        self.drop_every = drop_every
+        self.delivered = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+def _message(i: int) -> str:
+    message = MIMEText(f"Benchmark message {i}")
+    message["From"] = "bench@example.com"
+    message["To"] = f"parent{i}@example.com"
+    message["Subject"] = "Attendance Notification"
+    return message.as_string()
+
+
+def run_scenario(sink: SMTPSink, messages: int, size: int, rate: float = 0, messages_per_connection: int = 100) -> dict:
+    pool = SMTPPool(
+        host="127.0.0.1", port=sink.port, use_ssl=False, username="", password="",
+        size=size, rate=rate, messages_per_connection=messages_per_connection,
+    )
+    payloads = [_message(i) for i in range(messages)]
+    delivered_before = sink.delivered
+
+    def send(i):
+        start = time.perf_counter()
+        pool.send("bench@example.com", f"parent{i}@example.com", payloads[i])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=size) as executor:
+        samples = list(executor.map(send, range(messages)))
+    elapsed = time.perf_counter() - start
+    pool.close()
+
+    stats = _latency_stats(samples)
+    stats.pop("ops_per_sec_per_core")
+    stats.update({
+        "messages_per_sec": round(messages / elapsed, 2),
+        "elapsed_s": round(elapsed, 3),
+        "connections_opened": pool.connections_opened,
+        "delivered": sink.delivered - delivered_before,
+    })
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=150)
+    parser.add_argument("--message-ms", type=float, default=5)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rate", type=float, default=20)
+    parser.add_argument("--drop-every", type=int, default=25)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+
+    handshake_s, message_s = args.handshake_ms / 1000, args.message_ms / 1000
+    sink = SMTPSink(handshake_s, message_s)
+    dropping_sink = SMTPSink(handshake_s, message_s, drop_every=args.drop_every)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "messages": args.messages,
+            "handshake_ms": args.handshake_ms,
+            "message_ms": args.message_ms,
+        },
+        # Fewer messages: at one handshake each this is the slow baseline.
+        "fresh": run_scenario(sink, max(1, args.messages // 4), size=1, messages_per_connection=1),
+    }
+    for size in args.pool_sizes:
+        report[f"pooled_{size}"] = run_scenario(sink, args.messages, size=size)
+    report["rate_limited"] = run_scenario(sink, max(1, int(args.rate * 2)), size=2, rate=args.rate)
+    report["reconnect"] = run_scenario(dropping_sink, args.messages, size=2)
+
+    sink.shutdown()
+    dropping_sink.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compare the full-frame and two-stage face pipelines on a folder of photos.
+
+Layout: one sub-folder per person. The first image (sorted by name) in each
+folder is enrolled exactly as registration does; the rest are probes
+verified with each pipeline.
+
+    python -m benchmarks.compare_face_pipelines path/to/faces [--detect-size 400] [--margin 0.25]
+
+Reports per-pipeline latency, detection failures and match rate at the configured
+threshold, plus how far the two pipelines' encodings of the same probe drift.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+import numpy as np
+import core.face as face
+from core.face_backends import match_threshold_for_space
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+PIPELINES = ("full", "two_stage")
+
+
+def _percentile(samples, q):
+    return float(np.percentile(samples, q)) if samples else None
+
+
+def compare(corpus: Path) -> dict:
+    results = {name: {"latency_ms": [], "no_face": 0, "matches": 0, "probes": 0} for name in PIPELINES}
+    drift = []
+
+    for person in sorted(p for p in corpus.iterdir() if p.is_dir()):
+        images = sorted(p for p in person.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if len(images) < 2:
+            continue
+        reference, space, error = face.extract_enrollment_encoding(images[0].read_bytes())
+        if error:
+            print(f"Skipping {person.name}: {error}")
+            continue
+
+        for probe in images[1:]:
+            data = probe.read_bytes()
+            encodings = {}
+            for name in PIPELINES:
+                start = time.perf_counter()
+                encoding, error = face.extract_face_encoding(data, pipeline=name)
+                results[name]["latency_ms"].append((time.perf_counter() - start) * 1000)
+                results[name]["probes"] += 1
+                if error:
+                    results[name]["no_face"] += 1
+                    continue
+                encodings[name] = encoding
+                if np.linalg.norm(reference - encoding) <= match_threshold_for_space(space):
+                    results[name]["matches"] += 1
+            if len(encodings) == len(PIPELINES):
+                drift.append(float(np.linalg.norm(encodings["full"] - encodings["two_stage"])))
+
+    report = {}
+    for name, r in results.items():
+        report[name] = {
+            "probes": r["probes"],
+            "no_face": r["no_face"],
+            "match_rate": r["matches"] / r["probes"] if r["probes"] else None,
+            "p50_ms": _percentile(r["latency_ms"], 50),
+            "p95_ms": _percentile(r["latency_ms"], 95),
+        }
+    report["encoding_drift"] = {
+        "mean": float(np.mean(drift)) if drift else None,
+        "max": float(np.max(drift)) if drift else None,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path)
+    parser.add_argument("--detect-size", type=int, default=face.FACE_DETECT_SIZE)
+    parser.add_argument("--margin", type=float, default=face.FACE_CROP_MARGIN)
+    args = parser.parse_args()
+
+    face.FACE_DETECT_SIZE = args.detect_size
+    face.FACE_CROP_MARGIN = args.margin
+    print(json.dumps(compare(args.corpus), indent=2))
@@ -1,6 +1,7 @@
 from models import (Classroom, TimeSlot)
 from utils.db import Database  
 from datetime import datetime
+from core.geofence import polygon_centroid
 
 def create_classroom(class_number: str) -> Classroom:
     with Database.get_session() as session:
@@ -13,6 +14,29 @@ def create_classroom(class_number: str) -> Classroom:
         return True
 
 
+def set_classroom_fence(class_number: str, lat: float = None, lon: float = None,
+                        radius_meters: int = None, polygon: list = None) -> dict:
+    """Set a classroom's default attendance fence: a circle, a polygon of
+    [lat, lon] vertices, or both."""
+    if polygon is not None and len(polygon) < 3:
+        return {"success": False, "message": "A polygon fence needs at least 3 vertices"}
+    if polygon is None and (lat is None or lon is None or radius_meters is None):
+        return {"success": False, "message": "Give either a polygon or lat, lon and radius_meters"}
+
+    with Database.get_session() as session:
+        classroom = session.query(Classroom).filter_by(class_number=class_number).first()
+        if not classroom:
+            return {"success": False, "message": f"Classroom '{class_number}' not found"}
+        if lat is None or lon is None:
+            lat, lon = polygon_centroid(polygon)
+        classroom.lat = lat
+        classroom.long = lon
+        classroom.radius_meters = radius_meters
+        classroom.polygon = [[float(v_lat), float(v_lon)] for v_lat, v_lon in polygon] if polygon else None
+        session.commit()
+        return {"success": True, "message": f"Fence updated for classroom '{class_number}'"}
+
+
 def create_time_slot(name: str, start_time: str, end_time: str) -> bool:
     with Database.get_session() as session:
         existing_slot = session.query(TimeSlot).filter_by(name=name).first()
@@ -1,21 +1,29 @@
 from datetime import datetime, timedelta
 from sqlalchemy.exc import SQLAlchemyError
-from utils.db import Database
+from utils.db import Database, insert_for
 from models import AttendanceSession, ClassSchedule, User, UserRole,StudentCourseEnrollment, AttendanceStatus, AttendanceRecord
-from sqlalchemy import and_
+from sqlalchemy import and_, exists, literal, select
 from sqlalchemy.orm import joinedload
-from core.reg_attendance import clear_session_cache
-from utils.mail import send_email
+from core.reg_attendance import load_session_embeddings
+from core.session_registry import session_registry
+from core.notifications import enqueue_absences
+from core.attendance_stats import apply_deltas
+
+DEFAULT_RADIUS_METERS = 30
 
 def create_attendance_session(
     faculty_id: str,
-    lat: float,
-    lon: float,
-    radius_meters: int,
+    lat: float = None,
+    lon: float = None,
+    radius_meters: int = None,
     remarks: str = None
 ) -> dict:
+    """Open an attendance session for the faculty's scheduled class.
+
+    Without lat/lon the session inherits the classroom's fence (circle
+    and/or polygon); an explicit lat/lon gives a circle around that point.
+    """
     try:
-        clear_session_cache()
         with Database.get_session() as session:
             faculty = session.query(User).filter_by(reg_no=faculty_id).first()
             if not faculty:
@@ -60,6 +68,18 @@ def create_attendance_session(
                     "message": "An active attendance session already exists for this course today"
                 }
 
+            classroom = schedule.classroom
+            polygon = None
+            if lat is None or lon is None:
+                if classroom.lat is None or classroom.long is None:
+                    return {
+                        "success": False,
+                        "message": f"No location given and classroom {classroom.class_number} has no fence configured"
+                    }
+                lat, lon, polygon = classroom.lat, classroom.long, classroom.polygon
+            if radius_meters is None:
+                radius_meters = classroom.radius_meters or DEFAULT_RADIUS_METERS
+
             start_time = datetime.now()
 
             attendance_session = AttendanceSession(
@@ -69,6 +89,7 @@ def create_attendance_session(
                 lat=lat,
                 long=lon,
                 radius_meters=radius_meters,
+                polygon=polygon,
                 is_active=True,
                 remarks=remarks,
                 schedule_id=schedule.id
@@ -77,7 +98,7 @@ def create_attendance_session(
             session.add(attendance_session)
             session.commit()
 
-            return {
+            result = {
                 "success": True,
                 "message": f"Attendance session created successfully for {course.course_name}",
                 "session_id": attendance_session.id,
@@ -87,6 +108,19 @@ def create_attendance_session(
                 "time_slot": f"{schedule.time_slot.start_time}-{schedule.time_slot.end_time}",
             }
 
+            # Warm-up only: the session exists now, and every cache below is
+            # loaded lazily on first check-in if this fails.
+            try:
+                # Publish first so our own entry is stamped with the new course version.
+                session_registry.publish(attendance_session.course_id)
+                session_registry.load_roster(session, session_registry.put_session(attendance_session))
+                load_session_embeddings(session, attendance_session.id, attendance_session.course_id)
+            except Exception as e:
+                session.rollback()
+                print(f"Warning: warm-up for attendance session {result['session_id']} failed: {str(e)}")
+
+            return result
+
     except SQLAlchemyError as e:
         return {"success": False, "message": f"Database error: {str(e)}"}
     except Exception as e:
@@ -142,10 +176,13 @@ def get_attendance_summary():
         return {"success": False, "message": f"Unexpected error: {str(e)}"}
 
 def end_attendance_session(faculty_id: str) -> bool:
+    """Close the faculty's active session, marking everyone not yet recorded
+    as absent with a single INSERT ... SELECT and queueing their parents'
+    notifications in the same transaction."""
     try:
         with Database.get_session() as session:
-            faculty = session.query(User).filter_by(reg_no=faculty_id).first()
-            if not faculty or faculty.role != UserRole.faculty:
+            role = session.query(User.role).filter(User.reg_no == faculty_id).scalar()
+            if role != UserRole.faculty:
                 return False
             
             attendance_session = session.query(AttendanceSession).filter(
@@ -157,38 +194,52 @@ def end_attendance_session(faculty_id: str) -> bool:
             
             if not attendance_session:
                 return False
-            
-            enrolled_students = session.query(StudentCourseEnrollment).filter_by(
-                course_id=attendance_session.course_id
-            ).all()
-            
-            recorded_students = session.query(AttendanceRecord.student_id).filter_by(
-                session_id=attendance_session.id
-            ).all()
-            recorded_student_ids = {record[0] for record in recorded_students}
-            
-            for enrollment in enrolled_students:
-                if enrollment.student_id not in recorded_student_ids:
-                    
-                    absent_record = AttendanceRecord(
-                        session_id=attendance_session.id,
-                        student_id=enrollment.student_id,
-                        status=AttendanceStatus.absent,
-                        timestamp=datetime.now()
-                    )
-                    session.add(absent_record)
-                    student = enrollment.student
-                    student_name = student.name
-                    student_email = student.parent_email  
-
-                    send_email(student_name, student_email)
-            attendance_session.end_time = datetime.now()
+
+            current_time = datetime.now()
+            already_recorded = exists().where(
+                AttendanceRecord.session_id == attendance_session.id,
+                AttendanceRecord.student_id == StudentCourseEnrollment.student_id,
+            )
+            absentees = select(
+                literal(attendance_session.id),
+                StudentCourseEnrollment.student_id,
+                literal(AttendanceStatus.absent, AttendanceRecord.status.type),
+                literal(current_time, AttendanceRecord.timestamp.type),
+            ).where(
+                StudentCourseEnrollment.course_id == attendance_session.course_id,
+                ~already_recorded,
+            )
+            # A check-in that is inserted but not yet committed is invisible
+            # to NOT EXISTS; skip it on the unique index instead of failing.
+            absent_ids = session.execute(
+                insert_for(session, AttendanceRecord)
+                .from_select(["session_id", "student_id", "status", "timestamp"], absentees)
+                .on_conflict_do_nothing(index_elements=["session_id", "student_id"])
+                .returning(AttendanceRecord.student_id)
+            ).scalars().all()
+
+            # Delivered by core.notifications after commit; closing never waits on SMTP.
+            enqueue_absences(session, attendance_session.id, absent_ids)
+            apply_deltas(session, {
+                (student_id, attendance_session.course_id): {AttendanceStatus.absent.value: 1}
+                for student_id in absent_ids
+            })
+
+            attendance_session.end_time = current_time
             attendance_session.is_active = False
             
             session.commit()
-            clear_session_cache()
-            return True
-            
-    except:
+            session_id, course_id = attendance_session.id, attendance_session.course_id
+
+    except Exception as e:
+        print(f"Error ending attendance session: {str(e)}")
         return False
 
+    # The session is closed; other workers also drop it when its TTL runs out.
+    try:
+        session_registry.invalidate(session_id)
+        session_registry.publish(course_id)
+    except Exception as e:
+        print(f"Warning: could not broadcast the end of attendance session {session_id}: {str(e)}")
+    return True
+
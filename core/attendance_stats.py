@@ -0,0 +1,178 @@
+"""Per-student, per-course attendance counters.
+
+attendance_counters holds present/late/absent/total for every student and
+course, so a percentage is a primary-key read rather than an aggregate
+over attendance_records. Every path that writes records adjusts the
+counters in its own transaction:
+
+  * core.reg_attendance.insert_attendance_batch  (check-ins, group photos)
+  * core.attendance.end_attendance_session       (absentees)
+  * core.od.mark_attendance_for_leave            (absent -> present)
+
+Maintenance:
+
+    python -m core.attendance_stats check     # report drift, exit 1 if any
+    python -m core.attendance_stats rebuild   # recompute from attendance_records
+"""
+import sys
+from collections import defaultdict
+from sqlalchemy import case, delete, func, insert, literal, or_, select, text, union_all
+from utils.db import Database, insert_for
+from models import AttendanceCounter, AttendanceRecord, AttendanceSession, AttendanceStatus, Course
+
+STATUSES = [status.value for status in AttendanceStatus]  # also the counter column names
+COLUMNS = STATUSES + ["total"]
+
+
+def apply_deltas(session, deltas: dict):
+    """Add {(student_id, course_id): {column: n}} to the counters with one upsert.
+
+    Call inside the transaction that wrote the records. "total" is derived
+    from the status deltas, so a status change nets to zero.
+    """
+    rows = []
+    for (student_id, course_id), delta in sorted(deltas.items()):  # fixed lock order across writers
+        row = {"student_id": student_id, "course_id": course_id}
+        row.update({status: delta.get(status, 0) for status in STATUSES})
+        row["total"] = sum(row[status] for status in STATUSES)
+        if any(row[column] for column in COLUMNS):
+            rows.append(row)
+    if not rows:
+        return
+
+    stmt = insert_for(session, AttendanceCounter).values(rows)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["student_id", "course_id"],
+        set_={column: getattr(AttendanceCounter, column) + stmt.excluded[column] for column in COLUMNS},
+    ))
+
+
+def add_records(session, records):
+    """Count newly inserted records given as (session_id, student_id, status)"""
+    records = list(records)
+    if not records:
+        return
+    session_ids = {session_id for session_id, _, _ in records}
+    course_of = dict(
+        session.query(AttendanceSession.id, AttendanceSession.course_id)
+        .filter(AttendanceSession.id.in_(session_ids))
+        .all()
+    )
+    deltas = defaultdict(lambda: defaultdict(int))
+    for session_id, student_id, status in records:
+        deltas[(student_id, course_of[session_id])][status.value] += 1
+    apply_deltas(session, deltas)
+
+
+def _actual_counts():
+    """The counters as computed from attendance_records"""
+    return (
+        select(
+            AttendanceRecord.student_id,
+            AttendanceSession.course_id,
+            *(func.count().filter(AttendanceRecord.status == status).label(status.value) for status in AttendanceStatus),
+            func.count().label("total"),
+        )
+        .join(AttendanceSession, AttendanceSession.id == AttendanceRecord.session_id)
+        .group_by(AttendanceRecord.student_id, AttendanceSession.course_id)
+    )
+
+
+def rebuild_counters() -> int:
+    """Recompute every counter from attendance_records in one transaction"""
+    with Database.get_session() as session:
+        if session.get_bind().dialect.name == "postgresql":
+            # Writers wait for the rebuild, so none of their deltas is lost or counted twice.
+            session.execute(text("LOCK TABLE attendance_counters IN EXCLUSIVE MODE"))
+        session.execute(delete(AttendanceCounter))
+        result = session.execute(
+            insert(AttendanceCounter).from_select(["student_id", "course_id"] + COLUMNS, _actual_counts())
+        )
+        session.commit()
+        print(f"Rebuilt {result.rowcount} attendance counters")
+        return result.rowcount
+
+
+def check_counters() -> list:
+    """Compare the counters with attendance_records; returns the mismatches.
+
+    One statement, so it sees a single snapshot even while attendance is
+    being marked.
+    """
+    actual = _actual_counts().subquery()
+    stored = select(
+        AttendanceCounter.student_id,
+        AttendanceCounter.course_id,
+        literal("stored").label("source"),
+        *(getattr(AttendanceCounter, column) for column in COLUMNS),
+    )
+    computed = select(
+        actual.c.student_id,
+        actual.c.course_id,
+        literal("actual").label("source"),
+        *(actual.c[column] for column in COLUMNS),
+    )
+    both = union_all(stored, computed).subquery()
+
+    def side(source, column):
+        return func.sum(case((both.c.source == source, both.c[column]), else_=0))
+
+    query = (
+        select(
+            both.c.student_id,
+            both.c.course_id,
+            *(side("stored", column).label(f"stored_{column}") for column in COLUMNS),
+            *(side("actual", column).label(f"actual_{column}") for column in COLUMNS),
+        )
+        .group_by(both.c.student_id, both.c.course_id)
+        .having(or_(*(side("stored", column) != side("actual", column) for column in COLUMNS)))
+    )
+
+    with Database.get_session() as session:
+        mismatches = []
+        for row in session.execute(query).mappings():
+            mismatch = {"student_id": row["student_id"], "course_id": row["course_id"]}
+            mismatch["stored"] = {column: row[f"stored_{column}"] for column in COLUMNS}
+            mismatch["actual"] = {column: row[f"actual_{column}"] for column in COLUMNS}
+            mismatches.append(mismatch)
+            print(f"Mismatch {row['student_id']} / course {row['course_id']}: "
+                  f"stored {mismatch['stored']}, actual {mismatch['actual']}")
+        print(f"{len(mismatches)} attendance counters out of step")
+        return mismatches
+
+
+def get_student_attendance_summary(student_id: str, course_id: int = None) -> list:
+    """A student's counts and percentage per course; late counts as attended"""
+    with Database.get_session() as session:
+        query = (
+            session.query(AttendanceCounter, Course.course_code, Course.course_name)
+            .join(Course, Course.id == AttendanceCounter.course_id)
+            .filter(AttendanceCounter.student_id == student_id)
+        )
+        if course_id is not None:
+            query = query.filter(AttendanceCounter.course_id == course_id)
+
+        summary = []
+        for counter, course_code, course_name in query.order_by(Course.course_code):
+            attended = counter.present + counter.late
+            summary.append({
+                "course_id": counter.course_id,
+                "course_code": course_code,
+                "course_name": course_name,
+                "present": counter.present,
+                "late": counter.late,
+                "absent": counter.absent,
+                "total": counter.total,
+                "percentage": round(attended / counter.total * 100, 2) if counter.total else 0.0
+            })
+        return summary
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "rebuild":
+        rebuild_counters()
+    elif command == "check":
+        sys.exit(1 if check_counters() else 0)
+    else:
+        sys.exit(f"Unknown command '{command}'; use 'check' or 'rebuild'")
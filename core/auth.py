@@ -1,11 +1,11 @@
 from utils.db import Database
 from pydantic import BaseModel,Base64Bytes
 from models import User,UserRole
+from utils.embeddings import encode_embedding
+from utils.metrics import stage
 import bcrypt
 from typing import Optional
-import io
-import face_recognition
-from PIL import UnidentifiedImageError
+from core.face import extract_enrollment_encoding
 import base64
 
 class Register(BaseModel):
@@ -18,28 +18,20 @@ class Register(BaseModel):
     face: Optional[Base64Bytes]
 
 def register(details: Register):
-    with Database.get_session() as session:
-        if session.query(User).filter(User.reg_no == details.reg_no).first():
+    with Database.get_session() as session, stage("register.exists_check"):
+        if session.query(User.reg_no).filter(User.reg_no == details.reg_no).first():
             return False, "A user with this registration number already exists."
     try:
-        image_stream = io.BytesIO(details.face)
-        image = face_recognition.load_image_file(image_stream)
-        face_encodings = face_recognition.face_encodings(image)
-    except UnidentifiedImageError:
-        return False, "Invalid image format. Please upload a valid PNG or JPG file."
+        with stage("register.face"):
+            user_face_encoding, face_space, error = extract_enrollment_encoding(details.face)
     except Exception as e:
         return False, f"An unexpected error occurred while processing the image: {e}"
-
-    if not face_encodings:
-        return False, "No face could be detected in the image. Please use a clearer picture."
-
-    if len(face_encodings) > 1:
-        return False, "Multiple faces were detected. Please upload a picture with only one person."
-
-    user_face_encoding = face_encodings[0]
+    if error:
+        return False, error
 
     with Database.get_session() as session:
-        hashed_password = bcrypt.hashpw(details.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        with stage("register.bcrypt"):
+            hashed_password = bcrypt.hashpw(details.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         pfp_bytes = None
         if details.pfp:
             pfp_bytes = base64.b64decode(details.pfp) if isinstance(details.pfp, str) else details.pfp
@@ -50,11 +42,13 @@ def register(details: Register):
             parent_email=details.parent_email,
             role=details.role.value,
             pfp=pfp_bytes,
-            face=[float(x) for x in user_face_encoding.tolist()]
+            face=encode_embedding(user_face_encoding),
+            face_space=face_space
         )
         
-        session.add(new_user)
-        session.commit()
+        with stage("register.commit"):
+            session.add(new_user)
+            session.commit()
         return True, "User registered successfully."
     
 def login(reg_no: str, password: str):
@@ -0,0 +1,225 @@
+"""Bulk student onboarding from a CSV plus a zip of face photos.
+
+CSV columns: reg_no, name, password, parent_email, face_file and optionally
+role (defaults to student) and pfp_file. *_file values name members of the
+zip archive (matched by basename).
+
+Every processed row is appended to <IMPORT_REPORT_DIR>/<job_id>.jsonl as
+soon as its chunk commits, so an interrupted import resumes where it left
+off when re-run with the same job ID (by default derived from the CSV).
+
+    python -m core.bulk_import students.csv faces.zip [--job-id ID]
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import bcrypt
+from dotenv import load_dotenv
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from utils.db import Database
+from utils.embeddings import encode_embedding
+from utils.face_pool import _init_worker
+from models import User, UserRole
+
+load_dotenv()
+
+# Imports run beside the live FacePool, so they get a small pool of their own.
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 2))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 200))
+IMPORT_REPORT_DIR = Path(os.getenv("IMPORT_REPORT_DIR", "import_reports"))
+
+REQUIRED_COLUMNS = {"reg_no", "name", "password", "parent_email", "face_file"}
+
+
+def _prepare_row(row: dict, face_bytes: bytes, pfp_bytes: bytes):
+    """Encode the face and hash the password; runs in a worker process"""
+    from core.face import extract_enrollment_encoding
+
+    # Same reference encoding as core.auth.register.
+    encoding, face_space, error = extract_enrollment_encoding(face_bytes)
+    if error:
+        return None, error
+    try:
+        role = UserRole(row.get("role") or "student")
+    except ValueError:
+        return None, f"Unknown role '{row.get('role')}'"
+
+    return {
+        "reg_no": row["reg_no"],
+        "name": row["name"],
+        "parent_email": row["parent_email"],
+        "password_hash": bcrypt.hashpw(row["password"].encode("utf-8"), bcrypt.gensalt()).decode("utf-8"),
+        "role": role,
+        "pfp": pfp_bytes,
+        "face": encode_embedding(encoding),
+        "face_space": face_space,
+    }, None
+
+
+def _report_path(job_id: str) -> Path:
+    return IMPORT_REPORT_DIR / f"{job_id}.jsonl"
+
+
+def read_report(job_id: str) -> list:
+    path = _report_path(job_id)
+    if not path.exists():
+        return []
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _insert_users(session, users: list) -> dict:
+    """Insert a chunk in one statement; on conflict fall back row by row"""
+    try:
+        session.execute(insert(User), users)
+        session.commit()
+        return {user["reg_no"]: None for user in users}
+    except IntegrityError:
+        session.rollback()
+
+    errors = {}
+    for user in users:
+        try:
+            session.execute(insert(User), [user])
+            session.commit()
+            errors[user["reg_no"]] = None
+        except IntegrityError:
+            session.rollback()
+            errors[user["reg_no"]] = "Registration number or parent email already exists"
+    return errors
+
+
+def _open_import(csv_bytes: bytes, archive):
+    """Parse the CSV and open the zip (a path or binary file).
+
+    Returns ([(line_number, row), ...], ZipFile, error).
+    """
+    try:
+        reader = csv.DictReader(io.StringIO(csv_bytes.decode("utf-8-sig")))
+        missing = REQUIRED_COLUMNS - set(reader.fieldnames or [])
+        rows = list(enumerate(reader, start=2))
+    except (UnicodeDecodeError, csv.Error) as e:
+        return None, None, f"CSV could not be read: {e}"
+    if missing:
+        return None, None, f"CSV is missing columns: {', '.join(sorted(missing))}"
+
+    try:
+        zip_file = zipfile.ZipFile(archive)
+    except (zipfile.BadZipFile, OSError):
+        return None, None, "Face archive is not a valid zip file"
+    return rows, zip_file, None
+
+
+def validate_import(csv_bytes: bytes, archive) -> str:
+    """Why an import can't start (bad CSV header or zip), or None"""
+    _, zip_file, error = _open_import(csv_bytes, archive)
+    if zip_file is not None:
+        zip_file.close()
+    return error
+
+
+def import_students(csv_bytes: bytes, archive, job_id: str = None) -> dict:
+    """Import the CSV's rows; archive is the zip's path or a binary file"""
+    job_id = job_id or hashlib.sha256(csv_bytes).hexdigest()[:16]
+    all_rows, archive, error = _open_import(csv_bytes, archive)
+    if error:
+        return {"success": False, "message": error}
+
+    IMPORT_REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    done = {entry["row"] for entry in read_report(job_id)}
+    rows = [(number, row) for number, row in all_rows if number not in done]
+    members = {os.path.basename(name): name for name in archive.namelist() if not name.endswith("/")}
+
+    def read_member(filename):
+        member = members.get(os.path.basename(filename or ""))
+        return archive.read(member) if member else None
+
+    counts = {"created": 0, "skipped": 0, "failed": 0}
+    executor = ProcessPoolExecutor(
+        max_workers=IMPORT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    try:
+        with _report_path(job_id).open("a") as report:
+            for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+                chunk = rows[start:start + IMPORT_CHUNK_SIZE]
+                results = {}
+
+                with Database.get_session() as session:
+                    reg_nos = [row["reg_no"] for _, row in chunk]
+                    existing = {
+                        reg_no for (reg_no,) in
+                        session.query(User.reg_no).filter(User.reg_no.in_(reg_nos)).all()
+                    }
+
+                pending = []
+                for number, row in chunk:
+                    if row["reg_no"] in existing:
+                        results[number] = ("skipped", "User already exists")
+                        continue
+                    face_bytes = read_member(row["face_file"])
+                    if face_bytes is None:
+                        results[number] = ("failed", f"Face image '{row['face_file']}' not found in archive")
+                        continue
+                    pending.append((number, row, face_bytes, read_member(row.get("pfp_file"))))
+
+                futures = {
+                    number: executor.submit(_prepare_row, row, face_bytes, pfp_bytes)
+                    for number, row, face_bytes, pfp_bytes in pending
+                }
+                users, user_rows = [], {}
+                for number, future in futures.items():
+                    try:
+                        user, error = future.result()
+                    except Exception as e:
+                        user, error = None, f"Worker error: {e}"
+                    if error:
+                        results[number] = ("failed", error)
+                    elif user["reg_no"] in user_rows:
+                        results[number] = ("failed", "Duplicate registration number in CSV")
+                    else:
+                        users.append(user)
+                        user_rows[user["reg_no"]] = number
+
+                if users:
+                    with Database.get_session() as session:
+                        for reg_no, error in _insert_users(session, users).items():
+                            results[user_rows[reg_no]] = ("failed", error) if error else ("created", None)
+
+                for number, row in chunk:
+                    status, message = results[number]
+                    counts[status] += 1
+                    report.write(json.dumps({
+                        "row": number, "reg_no": row["reg_no"], "status": status, "message": message
+                    }) + "\n")
+                report.flush()
+                print(f"Import {job_id}: {start + len(chunk)}/{len(rows)} rows processed")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        archive.close()
+
+    return {
+        "success": True,
+        "message": f"Imported {counts['created']} users",
+        "job_id": job_id,
+        "resumed_rows": len(done),
+        **counts,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import students from a CSV and a zip of face photos")
+    parser.add_argument("csv_file", type=Path)
+    parser.add_argument("archive", type=Path)
+    parser.add_argument("--job-id")
+    args = parser.parse_args()
+    print(json.dumps(import_students(args.csv_file.read_bytes(), args.archive, args.job_id), indent=2))
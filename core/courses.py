@@ -4,6 +4,8 @@ from models import (Course, User, StudentCourseEnrollment, UserRole, Classroom,
                     ClassSchedule, DayOfWeek, ClassType,faculty_course_assignment)
 from typing import List, Optional
 from utils.db import Database  
+from core.session_registry import session_registry
+from core.timetable import invalidate_course, invalidate_students
 
 
 def create_course(course_name: str, course_code: str,credits: int,department: str) -> Optional[Course]:
@@ -36,12 +38,15 @@ def enroll_students_to_course(course_id: int, student_reg_nos: List[str]) -> boo
     """
     try:
         with Database.get_session() as session:
-            course = session.query(Course).filter_by(id=course_id).first()
+            # Locked so schedule changes and enrollments of a course serialize
+            # (see core.timetable.invalidate_course).
+            course = session.query(Course).filter_by(id=course_id).with_for_update().first()
             if not course:
                 print(f"Error: Course with ID {course_id} not found")
                 return False
 
             enrolled_count = 0
+            enrolled = []
             for reg_no in student_reg_nos:
                 student = session.query(User).filter_by(
                     reg_no=reg_no,
@@ -67,9 +72,14 @@ def enroll_students_to_course(course_id: int, student_reg_nos: List[str]) -> boo
                     course_id=course_id
                 )
                 session.add(enrollment)
+                enrolled.append(reg_no)
                 enrolled_count += 1
 
+            if enrolled:
+                invalidate_students(session, enrolled)
             session.commit()
+            # Open sessions of this course rebuild their rosters in every worker.
+            session_registry.publish(course_id)
             print(f"Successfully enrolled {enrolled_count} students to course '{course.course_code}'")
             return True
     except Exception as e:
@@ -169,7 +179,7 @@ def create_class_schedule(
 ) -> ClassSchedule:
    
     with Database.get_session() as session:
-        course = session.query(Course).filter(Course.course_code == course_code).one_or_none()
+        course = session.query(Course).filter(Course.course_code == course_code).with_for_update().one_or_none()
         if not course:
             raise ValueError(f"Course with code '{course_code}' not found.")
 
@@ -226,6 +236,23 @@ def create_class_schedule(
         )
         session.add(new_schedule)
         session.flush()
+        invalidate_course(session, course.id)
         session.commit()
         session.refresh(new_schedule)
         return new_schedule
+
+
+def deactivate_class_schedule(schedule_id: int) -> dict:
+    """Take a schedule off the timetable; its history stays in place."""
+    with Database.get_session() as session:
+        schedule = session.query(ClassSchedule).filter(ClassSchedule.id == schedule_id).one_or_none()
+        if not schedule:
+            return {"success": False, "message": f"Schedule {schedule_id} not found"}
+        if not schedule.is_active:
+            return {"success": True, "message": f"Schedule {schedule_id} is already inactive"}
+
+        session.query(Course.id).filter(Course.id == schedule.course_id).with_for_update().scalar()
+        schedule.is_active = False
+        invalidate_course(session, schedule.course_id)
+        session.commit()
+        return {"success": True, "message": f"Schedule {schedule_id} deactivated"}
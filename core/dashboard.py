@@ -1,100 +1,95 @@
-from sqlalchemy.orm import joinedload
+import base64
+import binascii
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, select, tuple_
 from utils.db import Database
-from models import (StudentCourseEnrollment, Course, ClassSchedule,
-                    AttendanceRecord,AttendanceSession,AttendanceStatus)
-from collections import defaultdict
+from models import Course, AttendanceRecord, AttendanceSession, AttendanceStatus
+from core.timetable import get_timetable
 
-def get_student_timetable(student_reg_no: str):
-    with Database.get_session() as session:
-        enrollments = (
-            session.query(StudentCourseEnrollment)
-            .options(
-                joinedload(StudentCourseEnrollment.course)
-                .joinedload(Course.schedules)
-                .joinedload(ClassSchedule.faculty),
-                joinedload(StudentCourseEnrollment.course)
-                .joinedload(Course.schedules)
-                .joinedload(ClassSchedule.classroom),
-                joinedload(StudentCourseEnrollment.course)
-                .joinedload(Course.schedules)
-                .joinedload(ClassSchedule.time_slot),
-            )
-            .filter(StudentCourseEnrollment.student_id == student_reg_no)
-            .all()
-        )
-
-        day_map = {
-            "monday": 15,
-            "tuesday": 16,
-            "wednesday": 17,
-            "thursday": 18,
-            "friday": 19,
-            "saturday": 20,
-            "sunday": 21, 
-        }
-
-        timetable = defaultdict(list)
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
 
-        for enrollment in enrollments:
-            for schedule in enrollment.course.schedules:
-                if not schedule.is_active:
-                    continue
+def get_student_timetable(student_reg_no: str):
+    # Served from the precomputed table; see core.timetable for invalidation.
+    return get_timetable(student_reg_no)
 
-                day_num = day_map[schedule.day_of_week.value]
+def _encode_cursor(start_time: datetime, session_id: int) -> str:
+    # Opaque and URL-safe: ISO offsets contain "+", which a query string turns into a space.
+    return base64.urlsafe_b64encode(f"{start_time.isoformat()}|{session_id}".encode()).decode()
 
-                start = schedule.time_slot.start_time.strftime("%I:%M %p")
-                end = schedule.time_slot.end_time.strftime("%I:%M %p")
 
-                timetable[day_num].append({
-                    "time": start,
-                    "subject": schedule.course.course_name,
-                    "duration": f"{start} - {end}",
-                    "type": schedule.class_type.value
-                })
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        start_time, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(start_time), int(session_id)
+    except (ValueError, binascii.Error):
+        raise ValueError(f"Invalid cursor '{cursor}'")
 
-        for d in day_map.values():
-            timetable[d] = sorted(timetable[d], key=lambda x: x["time"])
 
-        return dict(timetable)
+def get_faculty_attendance_history(faculty_id: str, limit: int = HISTORY_PAGE_SIZE, before: str = None,
+                                   start_date: date = None, end_date: date = None):
+    """One page of a faculty member's sessions, newest first, with present/total counts.
 
-def get_faculty_attendance_history(faculty_id: str):
+    Pages are keyset-paginated on (start_time, id): pass the returned cursor
+    as `before` for the next page. Returns (history, next_cursor), where
+    next_cursor is None on the last page.
+    """
     with Database.get_session() as session:
-        sessions = (
-            session.query(AttendanceSession)
-            .filter(AttendanceSession.faculty_id == faculty_id)
-            .order_by(AttendanceSession.start_time.desc())
-            .all()
+        page = select(
+            AttendanceSession.id,
+            AttendanceSession.course_id,
+            AttendanceSession.start_time,
+            AttendanceSession.end_time,
+        ).where(AttendanceSession.faculty_id == faculty_id)
+        if before:
+            page = page.where(tuple_(AttendanceSession.start_time, AttendanceSession.id) < _decode_cursor(before))
+        if start_date:
+            page = page.where(AttendanceSession.start_time >= datetime.combine(start_date, time.min))
+        if end_date:
+            page = page.where(AttendanceSession.start_time < datetime.combine(end_date + timedelta(days=1), time.min))
+        # Page the sessions first so only this page's records are aggregated.
+        page = (
+            page.order_by(AttendanceSession.start_time.desc(), AttendanceSession.id.desc())
+            .limit(limit + 1)
+            .subquery()
         )
 
-        history = []
-        for s in sessions:
-            course = session.query(Course).filter(Course.id == s.course_id).first()
-            if not course:
-                continue
-
-            records = (
-                session.query(AttendanceRecord)
-                .filter(AttendanceRecord.session_id == s.id)
-                .all()
+        rows = session.execute(
+            select(
+                page.c.id,
+                page.c.start_time,
+                page.c.end_time,
+                Course.course_name,
+                func.count(AttendanceRecord.id).filter(AttendanceRecord.status == AttendanceStatus.present),
+                func.count(AttendanceRecord.id),
             )
+            .select_from(page)
+            .join(Course, Course.id == page.c.course_id)
+            .outerjoin(AttendanceRecord, AttendanceRecord.session_id == page.c.id)
+            .group_by(page.c.id, page.c.start_time, page.c.end_time, Course.course_name)
+            .order_by(page.c.start_time.desc(), page.c.id.desc())
+        ).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].start_time, rows[-1].id)
 
-            total = len(records)
-            present = sum(1 for r in records if r.status == AttendanceStatus.present)
-
-            date_str = s.start_time.strftime("%b %d")  # e.g., "Sep 10"
-            if s.end_time:
-                time_str = f"{s.start_time.strftime('%I:%M %p')} - {s.end_time.strftime('%I:%M %p')}"
+        history = []
+        for session_id, start_time, end_time, course_name, present, total in rows:
+            date_str = start_time.strftime("%b %d")  # e.g., "Sep 10"
+            if end_time:
+                time_str = f"{start_time.strftime('%I:%M %p')} - {end_time.strftime('%I:%M %p')}"
             else:
-                time_str = s.start_time.strftime("%I:%M %p")
+                time_str = start_time.strftime("%I:%M %p")
 
             history.append({
-                "id": s.id,
+                "id": session_id,
                 "date": date_str,
-                "subject": course.course_name,
+                "subject": course_name,
                 "time": time_str,
                 "present": present,
                 "total": total
             })
 
-        return history
-
+        return history, next_cursor
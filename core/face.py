@@ -0,0 +1,474 @@
+import io
+import os
+import numpy as np
+import cv2
+from PIL import Image, UnidentifiedImageError
+from dotenv import load_dotenv
+from utils.metrics import stage
+from core.face_backends import get_backend, get_backend_for_space
+
+load_dotenv()
+
+# "full" detects on the whole (<=1024px) frame; "two_stage" detects on a
+# small reduced decode and encodes only the face crop.
+FACE_PIPELINE = os.getenv("FACE_PIPELINE", "full")
+FACE_DETECT_SIZE = int(os.getenv("FACE_DETECT_SIZE", 400))
+FACE_CROP_MARGIN = float(os.getenv("FACE_CROP_MARGIN", 0.25))
+FACE_CROP_SIZE = int(os.getenv("FACE_CROP_SIZE", 200))
+MAX_WORKING_SIZE = 1024
+# Classroom photos keep far more pixels: HOG misses faces much under 80px,
+# and a back-row face in a 4032px shot is barely that at full size.
+FACE_GROUP_MAX_SIZE = int(os.getenv("FACE_GROUP_MAX_SIZE", 4096))
+
+# Tiered verification (dlib space only): fast-path distances at or below
+# FACE_TIER_ACCEPT pass and at or above FACE_TIER_REJECT fail; anything
+# between is re-encoded with FACE_TIER2_MODEL and judged against the
+# backend's match threshold. Stored references, like the fast-path probe,
+# use the encoder's default ("small") model, so the escalated tier is the
+# only place a FACE_TIER2_MODEL encoding meets a reference.
+FACE_TIER_ACCEPT = float(os.getenv("FACE_TIER_ACCEPT", 0.45))
+FACE_TIER_REJECT = float(os.getenv("FACE_TIER_REJECT", 0.7))
+FACE_TIER2_MODEL = os.getenv("FACE_TIER2_MODEL", "large")
+FACE_TIER2_JITTERS = int(os.getenv("FACE_TIER2_JITTERS", 3))
+
+# A legacy-space reference is only replaced by a probe that cleared the
+# fast tier by this fraction of the threshold.
+FACE_UPGRADE_RATIO = float(os.getenv("FACE_UPGRADE_RATIO", 0.75))
+
+# Client-aligned face chips (see verify_face_chip)
+FACE_CHIP_MIN = int(os.getenv("FACE_CHIP_MIN", 112))
+FACE_CHIP_MAX = int(os.getenv("FACE_CHIP_MAX", 320))
+FACE_CHIP_MAX_ROLL = float(os.getenv("FACE_CHIP_MAX_ROLL", 15))
+FACE_CHIP_MAX_LANDMARK_ERROR = float(os.getenv("FACE_CHIP_MAX_LANDMARK_ERROR", 0.25))
+
+_REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+def _preprocess_image_fast(face_image_bytes: bytes, max_size: int = MAX_WORKING_SIZE):
+
+    try:
+        with stage("face.decode"):
+            nparr = np.frombuffer(face_image_bytes, np.uint8)
+            image_bgr = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if image_bgr is None:
+                return None, "Invalid image format"
+
+            image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+
+        height, width = image_rgb.shape[:2]
+        if width > max_size or height > max_size:
+            if width > height:
+                new_width = max_size
+                new_height = int((height * max_size) / width)
+            else:
+                new_height = max_size
+                new_width = int((width * max_size) / height)
+            with stage("face.resize"):
+                image_rgb = cv2.resize(image_rgb, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+        return image_rgb, None
+
+    except Exception as e:
+        return None, f"Image preprocessing error: {str(e)}"
+
+
+def _decode_reduced(face_image_bytes: bytes):
+    """Decode at the smallest power-of-two reduction that still keeps the
+    long side >= MAX_WORKING_SIZE, letting libjpeg skip most of the IDCT work.
+    """
+    try:
+        with Image.open(io.BytesIO(face_image_bytes)) as header:
+            width, height = header.size
+    except Exception:
+        return None, "Invalid image format"
+
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+        if max(width, height) / factor >= MAX_WORKING_SIZE:
+            flag = reduced_flag
+            break
+
+    with stage("face.decode"):
+        image_bgr = cv2.imdecode(np.frombuffer(face_image_bytes, np.uint8), flag)
+        if image_bgr is None:
+            return None, "Invalid image format"
+        return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB), None
+
+
+def _detect_two_stage(image_rgb, detect_size: int = None):
+    """Run HOG on a downscaled copy and map the boxes back to image_rgb"""
+    detect_size = detect_size or FACE_DETECT_SIZE
+    height, width = image_rgb.shape[:2]
+    scale = min(1.0, detect_size / max(height, width))
+    if scale < 1.0:
+        with stage("face.resize"):
+            small = cv2.resize(
+                image_rgb, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA
+            )
+    else:
+        small = image_rgb
+
+    with stage("face.detect"):
+        locations = get_backend().detect(small)
+
+    return [
+        (
+            max(0, int(top / scale)),
+            min(width, int(right / scale)),
+            min(height, int(bottom / scale)),
+            max(0, int(left / scale)),
+        )
+        for top, right, bottom, left in locations
+    ]
+
+
+def _crop_face(image_rgb, location, margin: float = None, crop_size: int = None):
+    """Cut the face plus a margin out of image_rgb, upscaled so the face is
+    at least crop_size px tall. Returns the crop and the face box inside it.
+    """
+    margin = FACE_CROP_MARGIN if margin is None else margin
+    crop_size = crop_size or FACE_CROP_SIZE
+    height, width = image_rgb.shape[:2]
+    top, right, bottom, left = location
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    y0, y1 = max(0, top - pad_y), min(height, bottom + pad_y)
+    x0, x1 = max(0, left - pad_x), min(width, right + pad_x)
+    crop = image_rgb[y0:y1, x0:x1]
+
+    scale = max(1.0, crop_size / max(1, bottom - top))
+    if scale > 1.0:
+        crop = cv2.resize(
+            crop, (int(crop.shape[1] * scale), int(crop.shape[0] * scale)), interpolation=cv2.INTER_LINEAR
+        )
+    box = (
+        int((top - y0) * scale),
+        int((right - x0) * scale),
+        int((bottom - y0) * scale),
+        int((left - x0) * scale),
+    )
+    return np.ascontiguousarray(crop), box
+
+
+def _locate_single_face(face_image_bytes: bytes, pipeline: str = None):
+    """Decode and detect; returns the image to encode from and the face box"""
+    pipeline = pipeline or FACE_PIPELINE
+    if pipeline == "two_stage":
+        image_rgb, error = _decode_reduced(face_image_bytes)
+        if error:
+            return None, None, error
+        face_locations = _detect_two_stage(image_rgb)
+    else:
+        image_rgb, error = _preprocess_image_fast(face_image_bytes)
+        if error:
+            return None, None, error
+        with stage("face.detect"):
+            face_locations = get_backend().detect(image_rgb)
+
+    if len(face_locations) == 0:
+        return None, None, "No face detected in the uploaded image"
+    if len(face_locations) > 1:
+        return None, None, "Multiple faces detected. Please upload image with single face"
+
+    if pipeline == "two_stage":
+        with stage("face.crop"):
+            image_rgb, location = _crop_face(image_rgb, face_locations[0])
+        return image_rgb, location, None
+
+    return image_rgb, face_locations[0], None
+
+
+def extract_face_encoding(face_image_bytes: bytes, pipeline: str = None):
+    """Decode an uploaded selfie and return the encoding of its single face,
+    in the configured backend's embedding space.
+
+    Runs inside the face worker pool, so it must stay free of DB access.
+    """
+    image_rgb, location, error = _locate_single_face(face_image_bytes, pipeline)
+    if error:
+        return None, error
+
+    with stage("face.encode"):
+        face_encodings = get_backend().encode(image_rgb, [location])
+    if len(face_encodings) == 0:
+        return None, "Failed to extract face features"
+
+    return face_encodings[0], None
+
+
+def extract_enrollment_encoding(face_image_bytes: bytes):
+    """Reference encoding for a new user, shared by core.auth.register and
+    core.bulk_import. The full-resolution image is used and the face is
+    encoded with the same model as the fast verification tier.
+
+    Returns (encoding, embedding_space, error).
+    """
+    try:
+        with stage("enroll.decode"):
+            with Image.open(io.BytesIO(face_image_bytes)) as image:
+                image_rgb = np.array(image.convert("RGB"))
+    except (UnidentifiedImageError, OSError):
+        return None, None, "Invalid image format. Please upload a valid PNG or JPG file."
+
+    backend = get_backend()
+    with stage("enroll.detect"):
+        face_locations = backend.detect(image_rgb)
+    if not face_locations:
+        return None, None, "No face could be detected in the image. Please use a clearer picture."
+    if len(face_locations) > 1:
+        return None, None, "Multiple faces were detected. Please upload a picture with only one person."
+
+    with stage("enroll.encode"):
+        face_encodings = backend.encode(image_rgb, face_locations)
+    if not face_encodings:
+        return None, None, "No face could be detected in the image. Please use a clearer picture."
+    return face_encodings[0], backend.embedding_space, None
+
+
+def verify_face(face_image_bytes: bytes, reference: np.ndarray, space: str, pipeline: str = None):
+    """Tiered 1:1 verification against a stored embedding from `space`.
+
+    The probe is encoded with whichever backend produces `space`, so faces
+    enrolled before a backend switch keep verifying. In the dlib space the
+    5-landmark encoding settles clear accepts and rejects, and distances in
+    between are re-encoded with the 68-landmark model and jitter, reusing
+    the detection from the first pass.
+
+    Returns (matched, distance, tier, upgraded, error): tier is "fast" or
+    "escalated"; upgraded is (space, encoding) of the probe in the
+    configured backend's space when a legacy-space face matched clearly on
+    the fast tier, so the caller can migrate the stored embedding.
+    """
+    backend = get_backend_for_space(space)
+    if backend is None:
+        return False, None, None, None, "Registered face is from an unavailable model. Please re-register"
+
+    image_rgb, location, error = _locate_single_face(face_image_bytes, pipeline)
+    if error:
+        return False, None, None, None, error
+
+    return _verify_located(backend, image_rgb, location, reference)
+
+
+def _chip_size_error(width: int, height: int):
+    if not (FACE_CHIP_MIN <= width <= FACE_CHIP_MAX) or abs(width - height) > 0.1 * width:
+        return f"Face chip must be roughly square and {FACE_CHIP_MIN}-{FACE_CHIP_MAX}px wide"
+    return None
+
+
+def _validate_chip(image_rgb, landmarks: dict):
+    """Landmark checks for a client-aligned chip; returns an error or None.
+
+    landmarks holds left_eye, right_eye and nose as [x, y] in chip pixels,
+    where left_eye is the eye with the smaller x.
+    """
+    height, width = image_rgb.shape[:2]
+    try:
+        left_eye, right_eye, nose = (
+            np.asarray(landmarks[name], dtype=np.float64).reshape(2)
+            for name in ("left_eye", "right_eye", "nose")
+        )
+    except (KeyError, TypeError, ValueError):
+        return "Face chip landmarks must include left_eye, right_eye and nose as [x, y]"
+
+    for point in (left_eye, right_eye, nose):
+        if not (0 <= point[0] < width and 0 <= point[1] < height):
+            return "Face chip landmarks fall outside the chip"
+
+    eye_vector = right_eye - left_eye
+    eye_distance = float(np.linalg.norm(eye_vector))
+    if eye_vector[0] <= 0 or not (0.25 * width <= eye_distance <= 0.6 * width):
+        return "Face chip eye spacing is implausible"
+    if abs(np.degrees(np.arctan2(eye_vector[1], eye_vector[0]))) > FACE_CHIP_MAX_ROLL:
+        return "Face chip is not aligned"
+    eye_center = (left_eye + right_eye) / 2
+    if not (left_eye[0] < nose[0] < right_eye[0]) or nose[1] <= eye_center[1]:
+        return "Face chip nose position is implausible"
+    return None
+
+
+def verify_face_chip(chip_bytes: bytes, landmarks: dict, reference: np.ndarray, space: str):
+    """verify_face for a chip the client already detected and aligned.
+
+    Skips full-frame detection. After the geometry checks the backend
+    re-predicts landmarks on the chip (or, without a landmark model, runs
+    the detector on the small chip) so a malformed or faceless chip is
+    still rejected. Same return shape as verify_face.
+    """
+    backend = get_backend_for_space(space)
+    if backend is None:
+        return False, None, None, None, "Registered face is from an unavailable model. Please re-register"
+
+    # Size is checked from the header so a tiny, highly compressed file
+    # can't make imdecode allocate a huge image.
+    try:
+        with Image.open(io.BytesIO(chip_bytes)) as header:
+            error = _chip_size_error(*header.size)
+    except Exception:
+        return False, None, None, None, "Invalid image format"
+    if error:
+        return False, None, None, None, error
+
+    with stage("face.decode"):
+        image_bgr = cv2.imdecode(np.frombuffer(chip_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image_bgr is None:
+        return False, None, None, None, "Invalid image format"
+    chip = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+
+    error = _validate_chip(chip, landmarks)
+    if error:
+        return False, None, None, None, error
+
+    # Encoders align with some context around the box, so give them a
+    # replicated border instead of black padding.
+    height, width = chip.shape[:2]
+    pad = int(width * FACE_CROP_MARGIN)
+    image_rgb = cv2.copyMakeBorder(chip, pad, pad, pad, pad, cv2.BORDER_REPLICATE)
+    location = (pad, pad + width, pad + height, pad)
+
+    with stage("face.chip_check"):
+        predicted = backend.landmarks(image_rgb, location)
+        if predicted is not None:
+            claimed = np.array([landmarks[name] for name in ("left_eye", "right_eye", "nose")], dtype=np.float64) + pad
+            eye_distance = np.linalg.norm(claimed[1] - claimed[0])
+            landmark_error = np.linalg.norm(predicted - claimed, axis=1).mean() / eye_distance
+            if landmark_error > FACE_CHIP_MAX_LANDMARK_ERROR:
+                return False, None, None, None, "Face chip landmarks do not match the face"
+        elif len(backend.detect(image_rgb)) != 1:
+            return False, None, None, None, "No single face found in the face chip"
+
+    return _verify_located(backend, image_rgb, location, reference)
+
+
+def _verify_located(backend, image_rgb, location, reference: np.ndarray):
+    with stage("face.encode"):
+        face_encodings = backend.encode(image_rgb, [location])
+    if len(face_encodings) == 0:
+        return False, None, None, None, "Failed to extract face features"
+
+    distance = float(np.linalg.norm(reference - face_encodings[0]))
+    tier = "fast"
+    if not backend.supports_escalation:
+        matched = distance <= backend.match_threshold
+    elif distance <= FACE_TIER_ACCEPT:
+        matched = True
+    elif distance >= FACE_TIER_REJECT:
+        matched = False
+    else:
+        with stage("face.encode_escalated"):
+            face_encodings = backend.encode(
+                image_rgb, [location], model=FACE_TIER2_MODEL, num_jitters=FACE_TIER2_JITTERS
+            )
+        if len(face_encodings) == 0:
+            return False, None, None, None, "Failed to extract face features"
+        distance = float(np.linalg.norm(reference - face_encodings[0]))
+        matched = distance <= backend.match_threshold
+        tier = "escalated"
+
+    # The probe becomes the student's permanent reference, so borderline
+    # (escalated) accepts never replace a legacy-space template.
+    upgraded = None
+    active = get_backend()
+    clear_accept = tier == "fast" and distance <= FACE_UPGRADE_RATIO * backend.match_threshold
+    if matched and clear_accept and active is not backend:
+        with stage("face.encode_upgrade"):
+            upgraded_encodings = active.encode(image_rgb, [location])
+        if upgraded_encodings:
+            upgraded = (active.embedding_space, upgraded_encodings[0])
+
+    return matched, distance, tier, upgraded, None
+
+
+def warm_up():
+    """Load the backend's models once so they are resident in the worker"""
+    get_backend().warm_up()
+
+
+def match_group_photo(photo_bytes: bytes, references: dict):
+    """Detect every face in a classroom photo and score each one against
+    the stored references ({space: (n, d) matrix}).
+
+    Returns ({space: (faces x n) scores}, error) with the same face order
+    in every space. A score is a distance divided by the space's match
+    threshold, decided with the same tiers as verify_face, so <= 1.0 is a
+    match.
+    """
+    image_rgb, error = _preprocess_image_fast(photo_bytes, FACE_GROUP_MAX_SIZE)
+    if error:
+        return {}, error
+
+    with stage("face.detect"):
+        face_locations = get_backend().detect(image_rgb)
+
+    scores = {}
+    for space, stored in references.items():
+        backend = get_backend_for_space(space)
+        if backend is None:
+            continue
+        if len(face_locations) == 0:
+            scores[space] = np.empty((0, len(stored)), dtype=np.float32)
+            continue
+        with stage("face.encode"):
+            encodings = backend.encode_batch([(image_rgb, face_locations)])[0]
+        distances = distance_matrix(np.array(encodings, dtype=np.float32), stored)
+        if backend.supports_escalation:
+            distances = _escalate_group(backend, image_rgb, face_locations, distances, stored)
+        scores[space] = distances / backend.match_threshold
+    return scores, None
+
+
+def _escalate_group(backend, image_rgb, face_locations, distances: np.ndarray, stored: np.ndarray):
+    """_verify_located's tiers over a whole distance matrix: fast rejects
+    become inf, and every face with a pair in between is re-encoded once
+    with FACE_TIER2_MODEL to settle those pairs.
+    """
+    between = (distances > FACE_TIER_ACCEPT) & (distances < FACE_TIER_REJECT)
+    tiered = np.where(distances >= FACE_TIER_REJECT, np.inf, distances)
+    rows = np.flatnonzero(between.any(axis=1))
+    if len(rows) == 0:
+        return tiered
+
+    with stage("face.encode_escalated"):
+        escalated = backend.encode(
+            image_rgb, [face_locations[i] for i in rows], model=FACE_TIER2_MODEL, num_jitters=FACE_TIER2_JITTERS
+        )
+    escalated_distances = distance_matrix(np.array(escalated, dtype=np.float32), stored)
+    tiered[rows] = np.where(between[rows], escalated_distances, tiered[rows])
+    return tiered
+
+
+def distance_matrix(uploaded: np.ndarray, stored: np.ndarray) -> np.ndarray:
+    """(uploaded x stored) Euclidean distances in one vectorized step"""
+    if len(uploaded) == 0 or len(stored) == 0:
+        return np.empty((len(uploaded), len(stored)), dtype=np.float32)
+    sq = (
+        np.einsum("ij,ij->i", uploaded, uploaded)[:, None]
+        + np.einsum("ij,ij->i", stored, stored)[None, :]
+        - 2.0 * uploaded @ stored.T
+    )
+    return np.sqrt(np.maximum(sq, 0.0))
+
+
+def assign_one_to_one(distances: np.ndarray, threshold: float):
+    """Greedily take the closest remaining pair under the threshold so no
+    face is credited to two students and no student to two faces.
+    Returns a list of (uploaded_index, stored_index, distance).
+    """
+    if distances.size == 0:
+        return []
+
+    candidates = np.argwhere(distances <= threshold)
+    order = np.argsort(distances[candidates[:, 0], candidates[:, 1]], kind="stable")
+
+    used_uploaded, used_stored, matches = set(), set(), []
+    for i, j in candidates[order]:
+        if i in used_uploaded or j in used_stored:
+            continue
+        used_uploaded.add(i)
+        used_stored.add(j)
+        matches.append((int(i), int(j), float(distances[i, j])))
+    return matches
@@ -0,0 +1,212 @@
+import os
+import numpy as np
+import cv2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FACE_BACKEND = os.getenv("FACE_BACKEND", "dlib")
+DLIB_EMBEDDING_SPACE = "dlib-128"
+DLIB_MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", 0.6))
+ONNX_MATCH_THRESHOLD = float(os.getenv("FACE_ONNX_THRESHOLD", 1.1))
+
+
+class FaceBackend:
+    """A face detector plus encoder.
+
+    Embeddings are only comparable with other embeddings from the same
+    embedding_space, which is stored next to every User.face.
+    """
+    name = None
+    embedding_space = None
+    match_threshold = None
+    supports_escalation = False
+
+    def detect(self, image_rgb) -> list:
+        """Face boxes as (top, right, bottom, left) in image_rgb pixels"""
+        raise NotImplementedError
+
+    def encode(self, image_rgb, locations, model: str = "small", num_jitters: int = 1) -> list:
+        raise NotImplementedError
+
+    def encode_batch(self, items) -> list:
+        """Encode [(image_rgb, locations), ...]; backends override to batch inference"""
+        return [self.encode(image_rgb, locations) for image_rgb, locations in items]
+
+    def landmarks(self, image_rgb, location):
+        """(3, 2) array of left eye, right eye and nose centres (image x, y),
+        ordered by x for the eyes, or None if the backend has no landmark model.
+        """
+        return None
+
+    def warm_up(self):
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        self.detect(blank)
+        self.encode(blank, [(0, 64, 64, 0)])
+
+
+class DlibBackend(FaceBackend):
+    """HOG detector and ResNet encoder from face_recognition/dlib"""
+    name = "dlib"
+    embedding_space = DLIB_EMBEDDING_SPACE
+    match_threshold = DLIB_MATCH_THRESHOLD
+    supports_escalation = True
+
+    def __init__(self):
+        import face_recognition
+        self._face_recognition = face_recognition
+
+    def detect(self, image_rgb) -> list:
+        return self._face_recognition.face_locations(image_rgb, model="hog")
+
+    def encode(self, image_rgb, locations, model: str = "small", num_jitters: int = 1) -> list:
+        return self._face_recognition.face_encodings(
+            image_rgb, locations, num_jitters=num_jitters, model=model
+        )
+
+    def landmarks(self, image_rgb, location):
+        found = self._face_recognition.face_landmarks(image_rgb, [location], model="small")
+        if not found:
+            return None
+        points = found[0]
+        eyes = sorted(
+            (np.mean(points["left_eye"], axis=0), np.mean(points["right_eye"], axis=0)),
+            key=lambda eye: eye[0],
+        )
+        return np.array([eyes[0], eyes[1], np.mean(points["nose_tip"], axis=0)], dtype=np.float64)
+
+    def warm_up(self):
+        super().warm_up()
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        self.encode(blank, [(0, 64, 64, 0)], model="large")
+
+
+class OnnxBackend(FaceBackend):
+    """ONNX Runtime CPU backend.
+
+    FACE_ONNX_DETECTOR is an UltraFace-style model (scores (1, N, 2) and
+    normalised boxes (1, N, 4)); FACE_ONNX_ENCODER is an ArcFace-style model
+    taking 112x112 RGB crops and returning one embedding per crop, which is
+    L2-normalised here. FACE_ONNX_THREADS sets intra-op threads per worker.
+    """
+    name = "onnx"
+    match_threshold = ONNX_MATCH_THRESHOLD
+
+    def __init__(self):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("FACE_BACKEND=onnx requires the onnxruntime package")
+
+        detector_path = os.getenv("FACE_ONNX_DETECTOR")
+        encoder_path = os.getenv("FACE_ONNX_ENCODER")
+        if not detector_path or not encoder_path:
+            raise RuntimeError("FACE_BACKEND=onnx requires FACE_ONNX_DETECTOR and FACE_ONNX_ENCODER")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv("FACE_ONNX_THREADS", 1))
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CPUExecutionProvider"]
+        self._detector = ort.InferenceSession(detector_path, options, providers=providers)
+        self._encoder = ort.InferenceSession(encoder_path, options, providers=providers)
+
+        self._detector_input = self._detector.get_inputs()[0]
+        self._detector_height, self._detector_width = self._detector_input.shape[2:4]
+        self._encoder_input = self._encoder.get_inputs()[0]
+        self._encoder_size = self._encoder_input.shape[2]
+        # A fixed leading dimension means the exported model can't batch.
+        self._encoder_batches = not isinstance(self._encoder_input.shape[0], int)
+
+        self.score_threshold = float(os.getenv("FACE_ONNX_SCORE", 0.7))
+        self.embedding_space = f"onnx-{os.path.splitext(os.path.basename(encoder_path))[0]}"
+
+    def detect(self, image_rgb) -> list:
+        height, width = image_rgb.shape[:2]
+        blob = cv2.resize(image_rgb, (self._detector_width, self._detector_height)).astype(np.float32)
+        blob = ((blob - 127.0) / 128.0).transpose(2, 0, 1)[None]
+        scores, boxes = self._detector.run(None, {self._detector_input.name: blob})
+
+        scores = scores[0, :, 1]
+        keep = scores > self.score_threshold
+        boxes = boxes[0][keep] * np.array([width, height, width, height], dtype=np.float32)
+        scores = scores[keep]
+        if len(scores) == 0:
+            return []
+
+        xywh = [[float(x0), float(y0), float(x1 - x0), float(y1 - y0)] for x0, y0, x1, y1 in boxes]
+        kept = np.array(cv2.dnn.NMSBoxes(xywh, scores.tolist(), self.score_threshold, 0.3)).reshape(-1)
+        return [
+            (
+                max(0, int(boxes[i][1])),
+                min(width, int(boxes[i][2])),
+                min(height, int(boxes[i][3])),
+                max(0, int(boxes[i][0])),
+            )
+            for i in kept
+        ]
+
+    def _chip(self, image_rgb, location):
+        top, right, bottom, left = location
+        side = max(bottom - top, right - left)
+        cy, cx = (top + bottom) // 2, (left + right) // 2
+        height, width = image_rgb.shape[:2]
+        y0, x0 = max(0, cy - side // 2), max(0, cx - side // 2)
+        crop = image_rgb[y0:min(height, y0 + side), x0:min(width, x0 + side)]
+        return cv2.resize(crop, (self._encoder_size, self._encoder_size), interpolation=cv2.INTER_LINEAR)
+
+    def _run_encoder(self, chips):
+        batch = ((np.stack(chips).astype(np.float32) - 127.5) / 127.5).transpose(0, 3, 1, 2)
+        if self._encoder_batches:
+            embeddings = self._encoder.run(None, {self._encoder_input.name: batch})[0]
+        else:
+            embeddings = np.concatenate([
+                self._encoder.run(None, {self._encoder_input.name: chip[None]})[0] for chip in batch
+            ])
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def encode(self, image_rgb, locations, model: str = "small", num_jitters: int = 1) -> list:
+        return self.encode_batch([(image_rgb, locations)])[0]
+
+    def encode_batch(self, items) -> list:
+        chips = [self._chip(image_rgb, location) for image_rgb, locations in items for location in locations]
+        if not chips:
+            return [[] for _ in items]
+        embeddings = list(self._run_encoder(chips))
+        results, offset = [], 0
+        for _, locations in items:
+            results.append(embeddings[offset:offset + len(locations)])
+            offset += len(locations)
+        return results
+
+
+_BACKENDS = {"dlib": DlibBackend, "onnx": OnnxBackend}
+_instances = {}
+
+
+def get_backend(name: str = None) -> FaceBackend:
+    """The configured backend (or a named one), created once per process"""
+    name = name or FACE_BACKEND
+    if name not in _instances:
+        if name not in _BACKENDS:
+            raise RuntimeError(f"Unknown FACE_BACKEND '{name}'")
+        _instances[name] = _BACKENDS[name]()
+    return _instances[name]
+
+
+def get_backend_for_space(space: str):
+    """Backend able to produce embeddings comparable with `space`, if any.
+
+    Legacy dlib embeddings stay verifiable after switching FACE_BACKEND
+    because the dlib backend is kept available as the compatibility path.
+    """
+    backend = get_backend()
+    if backend.embedding_space == space:
+        return backend
+    if space == DLIB_EMBEDDING_SPACE:
+        return get_backend("dlib")
+    return None
+
+
+def match_threshold_for_space(space: str) -> float:
+    """Distance threshold for a space, without loading any model"""
+    return DLIB_MATCH_THRESHOLD if space == DLIB_EMBEDDING_SPACE else ONNX_MATCH_THRESHOLD
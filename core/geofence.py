@@ -0,0 +1,120 @@
+"""Location checks for attendance sessions.
+
+A fence is a circle (centre plus radius), a polygon of [lat, lon] vertices,
+or both (a point must then satisfy the polygon). Fences are compiled once
+per session: the vertices are projected to a local equirectangular plane in
+metres and a bounding box is precomputed. A circle check is one planar
+distance (the exact haversine only decides points near the edge); a polygon
+check is a box test, then ray casting for the points inside the box.
+"""
+import math
+import threading
+import numpy as np
+from core.session_registry import session_registry
+
+EARTH_RADIUS_M = 6371000.0
+# Equirectangular error is far below this at classroom scale; only points
+# this close to a circle's edge are re-checked with haversine.
+EDGE_BAND_M = 1.0
+
+
+def haversine_many(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; numpy arrays or scalars"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _segment_distance(x, y, xs, ys, xe, ye) -> float:
+    dx, dy = xe - xs, ye - ys
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else min(1.0, max(0.0, ((x - xs) * dx + (y - ys) * dy) / length_sq))
+    return math.hypot(x - (xs + t * dx), y - (ys + t * dy))
+
+
+class Fence:
+    def __init__(self, lat: float, lon: float, radius_meters: float = None, polygon=None):
+        self.lat = lat
+        self.lon = lon
+        self.radius = radius_meters
+        self._cos_lat = math.cos(math.radians(lat))
+        self._m_per_deg = math.radians(1.0) * EARTH_RADIUS_M
+
+        if polygon:
+            vertices = np.asarray(polygon, dtype=np.float64)
+            xs, ys = self._project(vertices[:, 0], vertices[:, 1])
+            # Edge i runs from vertex i to vertex i + 1 (wrapping); plain
+            # floats, since numpy's per-call overhead dominates a single point.
+            xe, ye = np.roll(xs, -1), np.roll(ys, -1)
+            self._edges = list(zip(xs.tolist(), ys.tolist(), xe.tolist(), ye.tolist()))
+            self.polygon = vertices
+            lat_min, lon_min = vertices.min(axis=0)
+            lat_max, lon_max = vertices.max(axis=0)
+        else:
+            self.polygon = None
+            lat_margin = radius_meters / self._m_per_deg
+            lon_margin = lat_margin / max(self._cos_lat, 1e-6)
+            lat_min, lat_max = lat - lat_margin, lat + lat_margin
+            lon_min, lon_max = lon - lon_margin, lon + lon_margin
+        self.bbox = (lat_min, lon_min, lat_max, lon_max)
+
+    @classmethod
+    def from_session(cls, data: dict) -> "Fence":
+        return cls(data["lat"], data["long"], data["radius_meters"], data.get("polygon"))
+
+    def _project(self, lats, lons):
+        x = (np.asarray(lons, dtype=np.float64) - self.lon) * self._cos_lat * self._m_per_deg
+        y = (np.asarray(lats, dtype=np.float64) - self.lat) * self._m_per_deg
+        return x, y
+
+    def check(self, lat: float, lon: float):
+        """(inside, metres outside the fence) for one point"""
+        x = (lon - self.lon) * self._cos_lat * self._m_per_deg
+        y = (lat - self.lat) * self._m_per_deg
+
+        if self.polygon is not None:
+            lat_min, lon_min, lat_max, lon_max = self.bbox
+            if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max:
+                inside = False
+                for xs, ys, xe, ye in self._edges:
+                    if (ys > y) != (ye > y) and x < xs + (y - ys) * (xe - xs) / (ye - ys):
+                        inside = not inside
+                if inside:
+                    return True, 0.0
+            return False, min(_segment_distance(x, y, *edge) for edge in self._edges)
+
+        distance = math.hypot(x, y)
+        if abs(distance - self.radius) <= EDGE_BAND_M:
+            distance = float(haversine_many(self.lat, self.lon, lat, lon))
+        if distance <= self.radius:
+            return True, 0.0
+        return False, distance - self.radius
+
+
+_fences = {}
+_fences_lock = threading.Lock()
+
+
+def fence_for_session(data: dict) -> Fence:
+    """Compiled fence for a registry session entry, built once per process"""
+    fence = _fences.get(data["id"])
+    if fence is None:
+        fence = Fence.from_session(data)
+        with _fences_lock:
+            _fences[data["id"]] = fence
+    return fence
+
+
+def release_fence(session_id: int):
+    with _fences_lock:
+        _fences.pop(session_id, None)
+
+
+session_registry.on_invalidate(release_fence)
+
+
+def polygon_centroid(polygon) -> tuple:
+    """Vertex mean as (lat, lon); good enough as a centre for classroom-sized polygons"""
+    vertices = np.asarray(polygon, dtype=np.float64)
+    lat, lon = vertices.mean(axis=0)
+    return float(lat), float(lon)
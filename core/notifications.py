@@ -0,0 +1,282 @@
+"""Parent notifications via a transactional outbox.
+
+Producers insert NotificationOutbox rows in the same transaction as the
+event (see enqueue_absences), so closing a session never waits on SMTP and
+a mail failure never rolls the close back. A background dispatcher claims
+due rows, sends them and records the outcome, retrying with exponential
+backoff up to NOTIFY_MAX_ATTEMPTS.
+
+Claims use FOR UPDATE SKIP LOCKED plus a lease on next_attempt_at, so every
+app worker can run a dispatcher without sending anything twice; a worker
+that dies mid-send leaves its rows to be retried once the lease expires.
+
+NOTIFICATION_MODE=immediate (default) sends each absence as soon as it is
+queued. NOTIFICATION_MODE=digest holds absences for
+NOTIFY_DIGEST_WINDOW_MINUTES; once a parent's oldest pending absence is
+that old, all of that parent's due absences go out as one message.
+
+    python -m core.notifications    # deliver everything due, then exit
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import func, insert, literal, select, update
+from utils.db import Database
+from utils.mail import send_message, smtp_pool
+from utils.metrics import increment
+from models import (NotificationOutbox, NotificationStatus, User, AttendanceSession, Course,
+                    ClassSchedule, TimeSlot)
+
+load_dotenv()
+
+NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", 5))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 50))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", 6))
+NOTIFY_BACKOFF_SECONDS = float(os.getenv("NOTIFY_BACKOFF_SECONDS", 30))
+NOTIFY_LEASE_SECONDS = float(os.getenv("NOTIFY_LEASE_SECONDS", 300))
+NOTIFICATION_MODE = os.getenv("NOTIFICATION_MODE", "immediate")
+NOTIFY_DIGEST_WINDOW_MINUTES = float(os.getenv("NOTIFY_DIGEST_WINDOW_MINUTES", 1440))
+
+
+def enqueue_absences(session, session_id: int, student_ids: list) -> int:
+    """Queue one absence notice per student, inside the caller's transaction"""
+    if not student_ids:
+        return 0
+    recipients = select(
+        literal("absence"),
+        User.parent_email,
+        User.reg_no,
+        literal(session_id),
+    ).where(User.reg_no.in_(student_ids))
+    result = session.execute(
+        insert(NotificationOutbox).from_select(["kind", "recipient", "student_id", "session_id"], recipients)
+    )
+    return result.rowcount
+
+
+def _lease(session, claimable, count_attempt: bool = True) -> list:
+    values = {"next_attempt_at": func.now() + timedelta(seconds=NOTIFY_LEASE_SECONDS)}
+    if count_attempt:
+        values["attempts"] = NotificationOutbox.attempts + 1
+    return session.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(claimable.with_for_update(skip_locked=True).scalar_subquery()))
+        .values(**values)
+        .returning(
+            NotificationOutbox.id,
+            NotificationOutbox.recipient,
+            NotificationOutbox.student_id,
+            NotificationOutbox.session_id,
+            NotificationOutbox.attempts,
+        )
+    ).all()
+
+
+def _claim(session, limit: int) -> list:
+    # Due means not leased by another worker and not backing off.
+    due = select(NotificationOutbox.id).where(
+        NotificationOutbox.status == NotificationStatus.pending,
+        NotificationOutbox.next_attempt_at <= func.now(),
+    )
+    if NOTIFICATION_MODE != "digest":
+        return _lease(session, due.order_by(NotificationOutbox.id).limit(limit))
+
+    # A parent's digest goes out once their oldest absence has waited out the window.
+    rows = _lease(
+        session,
+        due.where(NotificationOutbox.created_at <= func.now() - timedelta(minutes=NOTIFY_DIGEST_WINDOW_MINUTES))
+        .order_by(NotificationOutbox.id)
+        .limit(limit),
+    )
+    if rows:
+        # Their newer absences ride along; they haven't waited their own
+        # window, so the attempt isn't counted against them.
+        rows += _lease(
+            session,
+            due.where(
+                NotificationOutbox.recipient.in_({row.recipient for row in rows}),
+                NotificationOutbox.id.not_in([row.id for row in rows]),
+            ),
+            count_attempt=False,
+        )
+    return rows
+
+
+def _absence_details(session, session_ids) -> dict:
+    """session_id -> (start_time, course_code, course_name, slot name, slot start, slot end)"""
+    rows = (
+        session.query(
+            AttendanceSession.id,
+            AttendanceSession.start_time,
+            Course.course_code,
+            Course.course_name,
+            TimeSlot.name,
+            TimeSlot.start_time,
+            TimeSlot.end_time,
+        )
+        .join(Course, Course.id == AttendanceSession.course_id)
+        .outerjoin(ClassSchedule, ClassSchedule.id == AttendanceSession.schedule_id)
+        .outerjoin(TimeSlot, TimeSlot.id == ClassSchedule.time_slot_id)
+        .filter(AttendanceSession.id.in_(session_ids))
+        .all()
+    )
+    return {row[0]: row[1:] for row in rows}
+
+
+def _describe(details) -> str:
+    start_time, course_code, course_name, slot_name, slot_start, slot_end = details
+    when = start_time.strftime("%d/%m/%y")
+    if slot_name:
+        when += f" for {slot_name} ({slot_start.strftime('%H:%M')}-{slot_end.strftime('%H:%M')})"
+    else:
+        when += f" at {start_time.strftime('%H:%M')}"
+    return f"{when}, {course_code} {course_name}"
+
+
+def render_absences(absences: list) -> tuple:
+    """(subject, body) for one parent; absences are (student_name, details) pairs"""
+    students = list(dict.fromkeys(name for name, _ in absences))
+    subject = f"Attendance Notification for {', '.join(students)}"
+    if len(absences) == 1:
+        name, details = absences[0]
+        lines = [f"{name} was absent on {_describe(details)}"]
+    else:
+        lines = []
+        for student in students:
+            lines.append(f"{student} was absent from the following classes:")
+            lines.extend(
+                f"  - {_describe(details)}"
+                for name, details in sorted(
+                    (absence for absence in absences if absence[0] == student), key=lambda absence: absence[1][0]
+                )
+            )
+    return subject, "Dear Parent,\n" + "\n".join(lines) + "\n\nBest regards,\nSRMIST"
+
+
+def _record_failure(session, row, error: Exception):
+    if row.attempts >= NOTIFY_MAX_ATTEMPTS:
+        values = {"status": NotificationStatus.failed}
+        increment("notifications.failed")
+    else:
+        delay = NOTIFY_BACKOFF_SECONDS * 2 ** max(0, row.attempts - 1)
+        values = {"next_attempt_at": func.now() + timedelta(seconds=delay)}
+        increment("notifications.retried")
+    session.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id == row.id)
+        .values(last_error=f"{type(error).__name__}: {error}", **values)
+    )
+
+
+def dispatch_once(limit: int = NOTIFY_BATCH_SIZE) -> int:
+    """Claim and send one batch of due notifications; returns how many were claimed"""
+    with Database.get_session() as session:
+        rows = _claim(session, limit)
+        if not rows:
+            return 0
+
+        names = dict(
+            session.query(User.reg_no, User.name)
+            .filter(User.reg_no.in_({row.student_id for row in rows}))
+            .all()
+        )
+        details = _absence_details(session, {row.session_id for row in rows})
+        # Commit the claim (and hand the connection back) before talking to SMTP.
+        session.commit()
+
+        # One message per row, or per parent in digest mode.
+        messages = {}
+        for row in rows:
+            key = row.recipient if NOTIFICATION_MODE == "digest" else row.id
+            messages.setdefault(key, []).append(row)
+
+        def deliver(group):
+            absences = [
+                (names.get(row.student_id, row.student_id), details[row.session_id])
+                for row in group
+                if row.session_id in details
+            ]
+            if not absences:
+                return None  # the session is gone; nothing left to report
+            try:
+                send_message(group[0].recipient, *render_absences(absences))
+            except Exception as e:
+                return e
+            return None
+
+        # One sender per pooled SMTP connection; the pool enforces the rate.
+        with ThreadPoolExecutor(max_workers=smtp_pool.size) as executor:
+            outcomes = list(executor.map(deliver, messages.values()))
+
+        sent = []
+        for group, error in zip(messages.values(), outcomes):
+            if error is None:
+                sent.extend(row.id for row in group)
+                continue
+            print(f"Notification to {group[0].recipient} failed (attempt {group[0].attempts}): {error}")
+            for row in group:
+                _record_failure(session, row, error)
+
+        if sent:
+            session.execute(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(sent))
+                .values(status=NotificationStatus.sent, sent_at=datetime.now(), last_error=None)
+            )
+            increment("notifications.sent", len(sent))
+            increment("notifications.messages", outcomes.count(None))
+        session.commit()
+        return len(rows)
+
+
+class NotificationDispatcher:
+    """Drains the outbox in the background for the lifetime of the app"""
+
+    def __init__(self, poll_seconds: float = NOTIFY_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._task = None
+        self._stopping = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        task, self._task = self._task, None
+        await task
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = await asyncio.to_thread(dispatch_once)
+            except Exception as e:
+                print(f"Notification dispatcher error: {e}")
+                claimed = 0
+            if claimed < NOTIFY_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+if __name__ == "__main__":
+    total = 0
+    while True:
+        claimed = dispatch_once()
+        total += claimed
+        if claimed < NOTIFY_BATCH_SIZE:
+            break
+    print(f"Processed {total} notifications")
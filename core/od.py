@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
@@ -6,6 +7,7 @@ from models import (
     AttendanceRecord, AttendanceStatus, StudentCourseEnrollment
 )
 from utils.db import Database
+from core.attendance_stats import apply_deltas
 from datetime import datetime, timezone
 
 def submit_leave_request(student_id: str, start_date: datetime, end_date: datetime, reason: str, attachment_url: str = None):
@@ -157,6 +159,7 @@ def mark_attendance_for_leave(student_id: str, start_date: datetime, end_date: d
             current_date += timedelta(days=1)
         
         updated_records = 0
+        deltas = defaultdict(lambda: defaultdict(int))
         
         for date_to_check in dates_to_check:
             attendance_sessions = session.query(AttendanceSession).filter(
@@ -175,8 +178,12 @@ def mark_attendance_for_leave(student_id: str, start_date: datetime, end_date: d
                 
                 if attendance_record and attendance_record.status == AttendanceStatus.absent:
                     attendance_record.status = AttendanceStatus.present
+                    counts = deltas[(student_id, att_session.course_id)]
+                    counts[AttendanceStatus.absent.value] -= 1
+                    counts[AttendanceStatus.present.value] += 1
                     updated_records += 1
         
+        apply_deltas(session, deltas)
         session.commit()
         
         return {
@@ -1,192 +1,352 @@
-import face_recognition
+import os
 import numpy as np
-from math import radians, cos, sin, asin, sqrt
+import asyncio
+import threading
+from collections import Counter, defaultdict
 from datetime import datetime
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import or_
-from sqlalchemy.orm import joinedload
-from utils.db import Database
-from models import AttendanceSession, AttendanceRecord, User, StudentCourseEnrollment, AttendanceStatus
-import cv2
+from dotenv import load_dotenv
+from utils.db import Database, insert_for
+from utils.face_pool import FacePool
+from utils.embeddings import decode_embedding_matrix, encode_embedding
+from utils.metrics import stage, increment
+from utils.admission import face_admission, QueueFull
+from utils.write_behind import WriteBehindBuffer
+from models import AttendanceRecord, User, StudentCourseEnrollment, AttendanceStatus
+from core.face import verify_face, verify_face_chip, match_group_photo, assign_one_to_one
+from core.session_registry import session_registry
+from core.geofence import fence_for_session
+from core.attendance_stats import add_records
+
+load_dotenv()
+
+MAX_GROUP_PHOTOS = 5
+
+# session_id -> {"matrices": {space: float32 (n, dim)}, "index": {reg_no: (space, row)},
+#                "course_version": session_registry.course_version when loaded}
+_session_embeddings = {}
+_session_embeddings_lock = threading.Lock()
+
+
+def load_session_embeddings(session, session_id: int, course_id: int) -> dict:
+    """Load the enrolled students' face embeddings into contiguous matrices,
+    one per embedding space.
+
+    Only reg_no and the face columns are selected, so the wide User row
+    (pfp blob etc.) is never fetched. Undecodable rows are logged and left
+    out. The result stays resident until the session ends.
+    """
+    # Read first: an enrollment published after this forces a later reload.
+    course_version = session_registry.course_version(course_id)
+    rows = (
+        session.query(User.reg_no, User.face_space, User.face)
+        .join(StudentCourseEnrollment, StudentCourseEnrollment.student_id == User.reg_no)
+        .filter(StudentCourseEnrollment.course_id == course_id)
+        .all()
+    )
+    by_space = defaultdict(list)
+    for reg_no, space, face in rows:
+        by_space[space].append((reg_no, face))
+
+    embeddings = {"matrices": {}, "index": {}, "course_version": course_version}
+    for space, members in by_space.items():
+        # A malformed row only locks out its own student, not the session.
+        size = Counter(len(face) for _, face in members).most_common(1)[0][0]
+        skipped = [reg_no for reg_no, face in members if len(face) != size]
+        members = [(reg_no, face) for reg_no, face in members if len(face) == size]
+        try:
+            matrix = decode_embedding_matrix(face for _, face in members)
+        except ValueError as e:
+            skipped += [reg_no for reg_no, _ in members]
+            members = []
+            print(f"Warning: {space} embeddings for session {session_id} are unreadable: {str(e)}")
+        if skipped:
+            print(f"Warning: skipping undecodable face embeddings of {', '.join(skipped)} in session {session_id}")
+        if not members:
+            continue
+        embeddings["matrices"][space] = matrix
+        for row, (reg_no, _) in enumerate(members):
+            embeddings["index"][reg_no] = (space, row)
+    with _session_embeddings_lock:
+        _session_embeddings[session_id] = embeddings
+    return embeddings
+
+
+def get_session_embeddings(session, session_id: int, course_id: int) -> dict:
+    """Cached embeddings for a session, loading them on first use in this process"""
+    embeddings = _session_embeddings.get(session_id)
+    if embeddings is None:
+        embeddings = load_session_embeddings(session, session_id, course_id)
+    return embeddings
+
+
+def get_student_embedding(session, session_id: int, course_id: int, student_id: str):
+    """Row lookup into the session matrix. A miss reloads it only if the
+    course has been published since it was built (late enrollments), so
+    students whose rows were skipped don't re-run the query on every try.
+    Returns (space, embedding) or (None, None).
+    """
+    embeddings = get_session_embeddings(session, session_id, course_id)
+    entry = embeddings["index"].get(student_id)
+    if entry is None:
+        if embeddings["course_version"] == session_registry.course_version(course_id):
+            return None, None
+        embeddings = load_session_embeddings(session, session_id, course_id)
+        entry = embeddings["index"].get(student_id)
+        if entry is None:
+            return None, None
+    space, row = entry
+    return space, embeddings["matrices"][space][row]
+
+
+def release_session_embeddings(session_id: int):
+    """Free the embedding matrix of a closed session"""
+    with _session_embeddings_lock:
+        _session_embeddings.pop(session_id, None)
+
+
+# Any worker that notices a session closed (itself or via the shared
+# version board) frees its matrix too.
+session_registry.on_invalidate(release_session_embeddings)
+
+
+def insert_attendance_batch(items: list) -> list:
+    """Insert verified attendance in one multi-row statement.
+
+    items are {"record": AttendanceRecord columns, "upgraded": (space, encoding)
+    or None}. Duplicates are skipped by the unique (session_id, student_id)
+    constraint; returns True for each item that was inserted. The attendance
+    counters are updated in the same transaction.
+    """
+    rows = [item["record"] for item in items]
+    with Database.get_session() as session:
+        try:
+            written = session.execute(
+                insert_for(session, AttendanceRecord)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["session_id", "student_id"])
+                .returning(AttendanceRecord.session_id, AttendanceRecord.student_id)
+            ).all()
+            inserted = {(session_id, student_id) for session_id, student_id in written}
+
+            results = []
+            for item in items:
+                key = (item["record"]["session_id"], item["record"]["student_id"])
+                results.append(key in inserted)
+                inserted.discard(key)  # a second submission in the same batch lost
+                if results[-1] and item["upgraded"] is not None:
+                    # Clear fast-tier match on a legacy embedding: move the student to the current backend's space.
+                    upgraded_space, upgraded_encoding = item["upgraded"]
+                    session.query(User).filter(User.reg_no == key[1]).update(
+                        {"face": encode_embedding(upgraded_encoding), "face_space": upgraded_space},
+                        synchronize_session=False,
+                    )
+            add_records(session, (
+                (item["record"]["session_id"], item["record"]["student_id"], item["record"]["status"])
+                for item, ok in zip(items, results) if ok
+            ))
+            session.commit()
+            return results
+        except Exception:
+            session.rollback()
+            raise
 
-_active_session_cache = {"session": None, "timestamp": None, "ttl": 300}  
 
+# ATTENDANCE_WRITE_BEHIND=1 coalesces concurrent check-ins into one commit
+# per ATTENDANCE_FLUSH_MS (or ATTENDANCE_FLUSH_BATCH records); started and
+# stopped by the app lifespan.
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "0") == "1"
+attendance_writer = WriteBehindBuffer(
+    "attendance_writer",
+    insert_attendance_batch,
+    max_batch=int(os.getenv("ATTENDANCE_FLUSH_BATCH", 64)),
+    max_delay=float(os.getenv("ATTENDANCE_FLUSH_MS", 5)) / 1000,
+)
 
-def haversine(lon1, lat1, lon2, lat2):
-    """Calculate the great circle distance in meters between two points"""
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * asin(sqrt(a))
-    r = 6371000  
-    return c * r
 
+async def register_attendance(
+    student_id: str, face_image_bytes: bytes, student_latitude: float, student_longitude: float,
+    chip_landmarks: dict = None
+) -> tuple[bool, str]:
+    """Verify a student's location and face and record them present.
 
-def _get_active_session(session):
-    """Get active session with caching to reduce DB calls (returns dict, not ORM object)"""
-    current_time = datetime.now()
+    With chip_landmarks, face_image_bytes is a client-aligned face chip and
+    full-frame detection is skipped (see core.face.verify_face_chip).
 
-    if (
-        _active_session_cache["session"]
-        and _active_session_cache["timestamp"]
-        and (current_time - _active_session_cache["timestamp"]).seconds < _active_session_cache["ttl"]
-    ):
-        return _active_session_cache["session"]
-
-    attendance_session = (
-        session.query(AttendanceSession)
-        .options(joinedload(AttendanceSession.course))
-        .filter(AttendanceSession.is_active)
-        .filter(
-            or_(
-                AttendanceSession.end_time.is_(None),
-                AttendanceSession.end_time > current_time,
-            )
-        )
-        .order_by(AttendanceSession.start_time.desc())
-        .first()
-    )
+    Enrollment and duplicate checks are answered from the session's
+    in-memory roster, so repeat submissions never reach the DB or the face
+    pool; the unique (session_id, student_id) constraint backstops races.
+    """
+    with Database.get_session() as session:
+        try:
+            with stage("attendance.session_lookup"):
+                attendance_session = session_registry.resolve_for_student(session, student_id)
+            if not attendance_session:
+                return False, "No active attendance session found for your courses"
 
-    session_data = None
-    if attendance_session:
-        session_data = {
-            "id": attendance_session.id,
-            "course_id": attendance_session.course_id,
-            "lat": attendance_session.lat,
-            "long": attendance_session.long,
-            "radius_meters": attendance_session.radius_meters,
-            "start_time": attendance_session.start_time,
-            "end_time": attendance_session.end_time,
-        }
+            if session_registry.is_marked(attendance_session["id"], student_id):
+                increment("attendance.duplicate_rejected")
+                return False, "Attendance already recorded for this session"
 
-    _active_session_cache["session"] = session_data
-    _active_session_cache["timestamp"] = current_time
+            with stage("attendance.geofence"):
+                fence = fence_for_session(attendance_session)
+                inside, outside = fence.check(student_latitude, student_longitude)
+            if not inside:
+                if fence.polygon is not None:
+                    return False, f"Location verification failed. You are {outside:.1f}m outside the classroom boundary"
+                return (
+                    False,
+                    f"Location verification failed. You are {outside + fence.radius:.1f}m away (max allowed: {attendance_session['radius_meters']}m)",
+                )
 
-    return session_data
+            with stage("attendance.embedding_lookup"):
+                face_space, stored_face_encoding = get_student_embedding(
+                    session, attendance_session["id"], attendance_session["course_id"], student_id
+                )
+            if stored_face_encoding is None:
+                return False, "No registered face found for this student"
 
+        except Exception as e:
+            session.rollback()
+            return False, f"Unexpected error: {str(e)}"
 
-def _preprocess_image_fast(face_image_bytes: bytes):
-    
+    # The DB connection is released before the face work so a burst of
+    # uploads waiting on the pool doesn't exhaust the connection pool.
+    try:
+        async with face_admission.slot():
+            with stage("attendance.face_total"):
+                if chip_landmarks is not None:
+                    job = FacePool.submit(
+                        verify_face_chip, face_image_bytes, chip_landmarks, stored_face_encoding, face_space
+                    )
+                else:
+                    job = FacePool.submit(verify_face, face_image_bytes, stored_face_encoding, face_space)
+                face_match, face_distance, tier, upgraded, error = await job
+    except QueueFull:
+        raise
+    except Exception as e:
+        return False, f"Unexpected error: {str(e)}"
+    if error:
+        return False, error
+
+    increment(f"face_verify.{tier}_{'accept' if face_match else 'reject'}")
+    if not face_match:
+        return False, f"Face verification failed. Distance: {face_distance:.3f}"
+
+    item = {
+        "record": {
+            "session_id": attendance_session["id"],
+            "student_id": student_id,
+            "status": AttendanceStatus.present,
+            "timestamp": datetime.now(),
+            "student_latitude": student_latitude,
+            "student_longitude": student_longitude,
+        },
+        "upgraded": upgraded,
+    }
     try:
-        nparr = np.frombuffer(face_image_bytes, np.uint8)
-        image_bgr = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if image_bgr is None:
-            return None, "Invalid image format"
-
-        image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-
-        height, width = image_rgb.shape[:2]
-        if width > 1024 or height > 1024:
-            if width > height:
-                new_width = 1024
-                new_height = int((height * 1024) / width)
+        with stage("attendance.commit"):
+            if attendance_writer.running:
+                inserted = await attendance_writer.submit(item)
             else:
-                new_height = 1024
-                new_width = int((width * 1024) / height)
-            image_rgb = cv2.resize(image_rgb, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                inserted = insert_attendance_batch([item])[0]
+    except Exception as e:
+        return False, f"Unexpected error: {str(e)}"
 
-        return image_rgb, None
+    # Either way the student is now marked; a conflict means another worker
+    # recorded them since our roster was built.
+    session_registry.mark(attendance_session["id"], [student_id])
+    if not inserted:
+        return False, "Attendance already recorded for this session"
+    return True, "Attendance registered successfully"
 
-    except Exception as e:
-        return None, f"Image preprocessing error: {str(e)}"
 
+async def register_group_attendance(faculty_id: str, photos: list[bytes]) -> dict:
+    """Mark everyone recognised in one or more classroom photos as present"""
+    if not photos:
+        return {"success": False, "message": "No photos uploaded"}
+    if len(photos) > MAX_GROUP_PHOTOS:
+        return {"success": False, "message": f"At most {MAX_GROUP_PHOTOS} photos can be uploaded at once"}
 
-def register_attendance(
-    student_id: str, face_image_bytes: bytes, student_latitude: float, student_longitude: float
-) -> tuple[bool, str]:
     with Database.get_session() as session:
         try:
-            current_time = datetime.now()
-
-            attendance_session = _get_active_session(session)
+            attendance_session = session_registry.for_faculty(session, faculty_id)
             if not attendance_session:
-                return False, "No active attendance session found"
-
-            query_result = (
-                session.query(User, StudentCourseEnrollment, AttendanceRecord)
-                .outerjoin(
-                    StudentCourseEnrollment,
-                    (StudentCourseEnrollment.student_id == User.reg_no)
-                    & (StudentCourseEnrollment.course_id == attendance_session["course_id"]),
-                )
-                .outerjoin(
-                    AttendanceRecord,
-                    (AttendanceRecord.student_id == User.reg_no)
-                    & (AttendanceRecord.session_id == attendance_session["id"]),
-                )
-                .filter(User.reg_no == student_id)
-                .first()
-            )
-
-            if not query_result or not query_result[0]:
-                return False, "Student not found"
-
-            student, enrollment, existing_record = query_result
-
-            if not enrollment:
-                return False, "Student is not enrolled in this course"
-
-            if existing_record:
-                return False, "Attendance already recorded for this session"
-
-            distance = haversine(
-                student_longitude,
-                student_latitude,
-                attendance_session["long"],
-                attendance_session["lat"],
-            )
-            if distance > attendance_session["radius_meters"]:
-                return (
-                    False,
-                    f"Location verification failed. You are {distance:.1f}m away (max allowed: {attendance_session['radius_meters']}m)",
-                )
+                return {"success": False, "message": "No active attendance session found"}
 
-            image_rgb, error = _preprocess_image_fast(face_image_bytes)
-            if error:
-                return False, error
-
-            face_locations = face_recognition.face_locations(image_rgb, model="hog")
-            if len(face_locations) == 0:
-                return False, "No face detected in the uploaded image"
-            if len(face_locations) > 1:
-                return False, "Multiple faces detected. Please upload image with single face"
-
-            face_encodings = face_recognition.face_encodings(image_rgb, face_locations, model="small")
-            if len(face_encodings) == 0:
-                return False, "Failed to extract face features"
-
-            uploaded_face_encoding = face_encodings[0]
-            stored_face_encoding = np.array(student.face)
-
-            face_distance = np.linalg.norm(stored_face_encoding - uploaded_face_encoding)
-            face_match = face_distance <= 0.6
-            if not face_match:
-                return False, f"Face verification failed. Distance: {face_distance:.3f}"
-
-            attendance_record = AttendanceRecord(
-                session_id=attendance_session["id"],
-                student_id=student_id,
-                status=AttendanceStatus.present,
-                timestamp=current_time,
-                student_latitude=student_latitude,
-                student_longitude=student_longitude,
+            session_id = attendance_session["id"]
+            embeddings = get_session_embeddings(session, session_id, attendance_session["course_id"])
+            marked_ids = set(session_registry.roster(session, attendance_session)["marked"])
+        except Exception as e:
+            return {"success": False, "message": f"Unexpected error: {str(e)}"}
+
+    reg_nos = [reg_no for reg_no in embeddings["index"] if reg_no not in marked_ids]
+    if not reg_nos:
+        return {"success": True, "message": "All enrolled students are already marked", "marked": []}
+
+    index = embeddings["index"]
+    members = {}
+    for reg_no in reg_nos:
+        members.setdefault(index[reg_no][0], []).append(reg_no)
+    references = {
+        space: embeddings["matrices"][space][[index[reg_no][1] for reg_no in space_members]]
+        for space, space_members in members.items()
+    }
+    try:
+        async with face_admission.slot():
+            results = await asyncio.gather(
+                *(FacePool.submit(match_group_photo, photo, references) for photo in photos)
             )
-            session.add(attendance_record)
-            session.commit()
+    except QueueFull:
+        raise
+    except Exception as e:
+        return {"success": False, "message": f"Unexpected error: {str(e)}"}
+
+    errors = [error for _, error in results if error]
+    scored = [scores for scores, error in results if not error]
+
+    # One column block per embedding space; every score is already scaled
+    # by its space's threshold so a single one-to-one assignment at 1.0
+    # covers them all.
+    columns, blocks = [], []
+    for space, space_members in members.items():
+        if not scored or any(space not in scores for scores in scored):
+            continue
+        blocks.append(np.vstack([scores[space] for scores in scored]))
+        columns.extend(space_members)
+    faces_detected = blocks[0].shape[0] if blocks else 0
+    if faces_detected == 0:
+        return {"success": False, "message": errors[0] if errors else "No faces detected in the uploaded photos"}
+    matches = assign_one_to_one(np.hstack(blocks), 1.0)
 
-            return True, "Attendance registered successfully"
+    current_time = datetime.now()
+    matched = [columns[j] for _, j, _ in matches]
+    items = [
+        {
+            "record": {
+                "session_id": session_id,
+                "student_id": reg_no,
+                "status": AttendanceStatus.present,
+                "timestamp": current_time,
+            },
+            "upgraded": None,
+        }
+        for reg_no in matched
+    ]
 
-        except IntegrityError:
-            session.rollback()
-            return False, "Attendance may already be recorded"
+    marked = []
+    if items:
+        try:
+            inserted = insert_attendance_batch(items)
         except Exception as e:
-            session.rollback()
-            return False, f"Unexpected error: {str(e)}"
-
-
-def clear_session_cache():
-    """Clear the active session cache - call this when sessions are updated"""
-    global _active_session_cache
-    _active_session_cache["session"] = None
-    _active_session_cache["timestamp"] = None
+            return {"success": False, "message": f"Unexpected error: {str(e)}"}
+        # Students marked meanwhile by their own check-in are skipped, not errors.
+        marked = [reg_no for reg_no, ok in zip(matched, inserted) if ok]
+        session_registry.mark(session_id, matched)
+
+    return {
+        "success": True,
+        "message": f"Marked {len(marked)} students present",
+        "marked": marked,
+        "faces_detected": faces_detected,
+        "unmatched_faces": faces_detected - len(marked),
+    }
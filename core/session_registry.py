@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import or_
+from dotenv import load_dotenv
+from models import AttendanceSession, AttendanceRecord, StudentCourseEnrollment
+from utils.invalidation import get_board, GLOBAL_SLOT
+
+load_dotenv()
+
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", 300))
+
+
+def _session_data(attendance_session) -> dict:
+    return {
+        "id": attendance_session.id,
+        "course_id": attendance_session.course_id,
+        "faculty_id": attendance_session.faculty_id,
+        "lat": attendance_session.lat,
+        "long": attendance_session.long,
+        "radius_meters": attendance_session.radius_meters,
+        "polygon": attendance_session.polygon,
+        "start_time": attendance_session.start_time,
+        "end_time": attendance_session.end_time,
+    }
+
+
+def _is_open(data: dict, now: datetime) -> bool:
+    end_time = data["end_time"]
+    if end_time is None:
+        return True
+    if end_time.tzinfo is not None:
+        now = now.astimezone(end_time.tzinfo)
+    return end_time > now
+
+
+class SessionRegistry:
+    """In-memory view of every active attendance session (plain dicts, not
+    ORM objects), keyed by session ID and indexed by course.
+
+    Entries expire individually after `ttl` seconds and are re-validated one
+    by one; opening or closing a session touches only that entry. The full
+    list of active sessions is re-read from the DB at most once per `ttl`.
+
+    Other worker processes learn about changes through a shared version
+    board (utils.invalidation): publish() bumps the global slot, which makes
+    every registry re-read the active list, and the course's slot, which
+    makes them re-validate that course's entries. Checking is a memory read,
+    so the TTL can stay long.
+
+    Each session also carries a roster: the set of enrolled reg_nos and the
+    set already marked. They are built when the session opens (or on first
+    use in this process), kept current by mark(), and rebuilt whenever the
+    entry is re-validated, at least once per `ttl`, which also picks up
+    marks made by other workers.
+    """
+
+    def __init__(self, ttl: int = SESSION_CACHE_TTL, board=None):
+        self.ttl = ttl
+        self._board = board
+        self._lock = threading.Lock()
+        self._entries = {}  # session_id -> (data, expires_at, course_version)
+        self._by_course = {}  # course_id -> {session_id, ...}
+        self._listed_until = 0.0
+        self._seen_global = None
+        self._invalidation_hooks = []
+        self._rosters = {}  # session_id -> {"enrolled": set, "marked": set}
+
+    @property
+    def board(self):
+        if self._board is None:
+            self._board = get_board()
+        return self._board
+
+    def on_invalidate(self, hook):
+        """Call hook(session_id) whenever an entry is dropped, in any way"""
+        self._invalidation_hooks.append(hook)
+
+    def publish(self, course_id: int):
+        """Tell every worker that this course's sessions changed"""
+        self.board.bump(GLOBAL_SLOT)
+        self.board.bump(self.board.slot_for(course_id))
+
+    def course_version(self, course_id: int):
+        """The course's slot on the version board; changes whenever publish() runs for it"""
+        return self.board.read(self.board.slot_for(course_id))
+
+    def put(self, data: dict, renew: bool = True):
+        """Store an entry; renew=False keeps an unchanged entry's expiry, so
+        re-listing never postpones its re-validation (and roster reload)."""
+        course_version = self.course_version(data["course_id"])
+        with self._lock:
+            previous = self._entries.get(data["id"])
+            expires_at = time.monotonic() + self.ttl
+            if previous is not None and previous[2] != course_version:
+                # The course changed (e.g. new enrollments): rebuild the roster.
+                self._rosters.pop(data["id"], None)
+            elif previous is not None and not renew:
+                expires_at = previous[1]
+            self._entries[data["id"]] = (data, expires_at, course_version)
+            self._by_course.setdefault(data["course_id"], set()).add(data["id"])
+        return data
+
+    def put_session(self, attendance_session) -> dict:
+        return self.put(_session_data(attendance_session))
+
+    def _dropped(self, session_ids):
+        for session_id in session_ids:
+            self._rosters.pop(session_id, None)
+            for hook in self._invalidation_hooks:
+                hook(session_id)
+
+    def invalidate(self, session_id: int):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                course_sessions = self._by_course.get(entry[0]["course_id"], set())
+                course_sessions.discard(session_id)
+                if not course_sessions:
+                    self._by_course.pop(entry[0]["course_id"], None)
+        self._dropped([session_id])
+
+    def invalidate_course(self, course_id: int):
+        with self._lock:
+            session_ids = self._by_course.pop(course_id, set())
+            for session_id in session_ids:
+                self._entries.pop(session_id, None)
+        self._dropped(session_ids)
+
+    def clear(self):
+        with self._lock:
+            session_ids = list(self._entries)
+            self._entries.clear()
+            self._by_course.clear()
+            self._listed_until = 0.0
+        self._dropped(session_ids)
+
+    def _active_query(self, db):
+        return (
+            db.query(AttendanceSession)
+            .filter(AttendanceSession.is_active)
+            .filter(
+                or_(
+                    AttendanceSession.end_time.is_(None),
+                    AttendanceSession.end_time > datetime.now(),
+                )
+            )
+        )
+
+    def _refresh(self, db):
+        active = {s.id: _session_data(s) for s in self._active_query(db).all()}
+        with self._lock:
+            stale = [session_id for session_id in self._entries if session_id not in active]
+        for session_id in stale:
+            self.invalidate(session_id)
+        for data in active.values():
+            self.put(data, renew=False)
+        self._listed_until = time.monotonic() + self.ttl
+
+    def _revalidate(self, db, session_id: int):
+        attendance_session = self._active_query(db).filter(AttendanceSession.id == session_id).first()
+        if attendance_session:
+            self._rosters.pop(session_id, None)
+            self.put_session(attendance_session)
+        else:
+            self.invalidate(session_id)
+
+    def load_roster(self, db, data: dict) -> dict:
+        enrolled = {
+            student_id for (student_id,) in
+            db.query(StudentCourseEnrollment.student_id)
+            .filter(StudentCourseEnrollment.course_id == data["course_id"])
+            .all()
+        }
+        marked = {
+            student_id for (student_id,) in
+            db.query(AttendanceRecord.student_id)
+            .filter(AttendanceRecord.session_id == data["id"])
+            .all()
+        }
+        roster = {"enrolled": enrolled, "marked": marked}
+        self._rosters[data["id"]] = roster
+        return roster
+
+    def roster(self, db, data: dict) -> dict:
+        roster = self._rosters.get(data["id"])
+        if roster is None:
+            roster = self.load_roster(db, data)
+        return roster
+
+    def is_marked(self, session_id: int, student_id: str) -> bool:
+        roster = self._rosters.get(session_id)
+        return roster is not None and student_id in roster["marked"]
+
+    def mark(self, session_id: int, student_ids):
+        roster = self._rosters.get(session_id)
+        if roster is not None:
+            roster["marked"].update(student_ids)
+
+    def active(self, db) -> list:
+        """All currently open sessions"""
+        global_version = self.board.read(GLOBAL_SLOT)
+        if global_version != self._seen_global:
+            self._seen_global = global_version
+            self._listed_until = 0.0
+
+        now = time.monotonic()
+        if now >= self._listed_until:
+            self._refresh(db)
+        with self._lock:
+            stale = [
+                session_id
+                for session_id, (data, expires_at, course_version) in self._entries.items()
+                if expires_at <= now or course_version != self.board.read(self.board.slot_for(data["course_id"]))
+            ]
+        for session_id in stale:
+            self._revalidate(db, session_id)
+
+        current_time = datetime.now()
+        with self._lock:
+            return [data for data, _, _ in self._entries.values() if _is_open(data, current_time)]
+
+    def get(self, db, session_id: int):
+        for data in self.active(db):
+            if data["id"] == session_id:
+                return data
+        return None
+
+    def for_faculty(self, db, faculty_id: str):
+        """The open session started by a faculty member, if any"""
+        sessions = [data for data in self.active(db) if data["faculty_id"] == faculty_id]
+        return max(sessions, key=lambda data: data["id"]) if sessions else None
+
+    def resolve_for_student(self, db, student_id: str):
+        """The open session of a course the student is enrolled in, if any.
+
+        Answered from the in-memory rosters; the DB is only touched to build
+        a roster this process hasn't seen yet.
+        """
+        candidates = [
+            data for data in self.active(db)
+            if student_id in self.roster(db, data)["enrolled"]
+        ]
+        if not candidates:
+            return None
+        # Overlapping sessions for one student: the most recently opened wins.
+        return max(candidates, key=lambda data: data["id"])
+
+
+session_registry = SessionRegistry()
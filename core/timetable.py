@@ -0,0 +1,161 @@
+"""Precomputed per-student timetables.
+
+A student's timetable only changes when a schedule is created or
+deactivated or the student is enrolled in a course, so each one is built
+once, stored serialized in student_timetables and served from there.
+
+The write paths (core.courses) call invalidate_* in their own transaction,
+which bumps the students' version and clears the payload. A build records
+the version it started from and is stored only if that version is still
+current, so a build that raced a change is returned once but never cached.
+Builds happen lazily on read, or all at once with:
+
+    python -m core.timetable [reg_no ...]
+"""
+import sys
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import bindparam, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from utils.db import Database, insert_for
+from models import StudentCourseEnrollment, Course, ClassSchedule, TimeSlot, StudentTimetable, User, UserRole
+
+DAY_MAP = {
+    "monday": 15,
+    "tuesday": 16,
+    "wednesday": 17,
+    "thursday": 18,
+    "friday": 19,
+    "saturday": 20,
+    "sunday": 21,
+}
+
+
+def build_timetables(session, student_ids) -> dict:
+    """student_id -> timetable for each given student, from one narrow query"""
+    rows = (
+        session.query(
+            StudentCourseEnrollment.student_id,
+            Course.course_name,
+            ClassSchedule.day_of_week,
+            ClassSchedule.class_type,
+            TimeSlot.start_time,
+            TimeSlot.end_time,
+        )
+        .join(Course, Course.id == StudentCourseEnrollment.course_id)
+        .join(ClassSchedule, ClassSchedule.course_id == Course.id)
+        .join(TimeSlot, TimeSlot.id == ClassSchedule.time_slot_id)
+        .filter(StudentCourseEnrollment.student_id.in_(student_ids), ClassSchedule.is_active)
+        .all()
+    )
+
+    timetables = {student_id: defaultdict(list) for student_id in student_ids}
+    for student_id, course_name, day_of_week, class_type, start_time, end_time in rows:
+        start = start_time.strftime("%I:%M %p")
+        end = end_time.strftime("%I:%M %p")
+        timetables[student_id][DAY_MAP[day_of_week.value]].append({
+            "time": start,
+            "subject": course_name,
+            "duration": f"{start} - {end}",
+            "type": class_type.value
+        })
+
+    result = {}
+    for student_id, timetable in timetables.items():
+        # String keys: this is the JSON the endpoint always returned.
+        result[student_id] = {
+            str(day): sorted(timetable[day], key=lambda x: x["time"]) for day in DAY_MAP.values()
+        }
+    return result
+
+
+def _build_and_store(session, student_ids: list) -> dict:
+    """Build timetables and store each one whose version is unchanged since
+    before the build started"""
+    # Rows must exist before the versions are read, so a concurrent
+    # invalidation always has something to bump.
+    session.execute(
+        insert_for(session, StudentTimetable)
+        .values([{"student_id": student_id, "version": 0} for student_id in student_ids])
+        .on_conflict_do_nothing(index_elements=["student_id"])
+    )
+    session.commit()
+    versions = dict(session.execute(
+        select(StudentTimetable.student_id, StudentTimetable.version)
+        .where(StudentTimetable.student_id.in_(student_ids))
+    ).all())
+
+    timetables = build_timetables(session, student_ids)
+
+    table = StudentTimetable.__table__
+    session.connection().execute(
+        update(table)
+        .where(table.c.student_id == bindparam("b_student_id"), table.c.version == bindparam("b_version"))
+        .values(payload=bindparam("b_payload"), built_at=bindparam("b_built_at")),
+        [
+            {"b_student_id": student_id, "b_version": versions[student_id],
+             "b_payload": timetable, "b_built_at": datetime.now()}
+            for student_id, timetable in timetables.items()
+        ],
+    )
+    session.commit()
+    return timetables
+
+
+def get_timetable(student_id: str) -> dict:
+    with Database.get_session() as session:
+        cached = session.query(StudentTimetable.payload).filter(StudentTimetable.student_id == student_id).scalar()
+        if cached is not None:
+            return cached
+
+        try:
+            return _build_and_store(session, [student_id])[student_id]
+        except IntegrityError:
+            # Not a known student: nothing to cache.
+            session.rollback()
+            return build_timetables(session, [student_id])[student_id]
+
+
+def _bump(session, rows):
+    """Clear and re-version the given students' timetables (rows: a list of
+    dicts or a select of student_id, version)"""
+    insert = insert_for(session, StudentTimetable)
+    insert = insert.values(rows) if isinstance(rows, list) else insert.from_select(["student_id", "version"], rows)
+    session.execute(insert.on_conflict_do_update(
+        index_elements=["student_id"],
+        set_={"version": StudentTimetable.version + 1, "payload": None, "built_at": None},
+    ))
+
+
+def invalidate_students(session, student_ids):
+    """Drop cached timetables; call inside the transaction making the change"""
+    _bump(session, [{"student_id": student_id, "version": 1} for student_id in student_ids])
+
+
+def invalidate_course(session, course_id: int):
+    """Drop cached timetables of everyone enrolled in a course.
+
+    The caller must hold the course row lock (SELECT ... FOR UPDATE) so
+    an enrollment committing concurrently can't be missed.
+    """
+    _bump(session, select(StudentCourseEnrollment.student_id, literal(1)).where(
+        StudentCourseEnrollment.course_id == course_id
+    ))
+
+
+def rebuild_timetables(student_ids=None, chunk_size: int = 500) -> int:
+    """Rebuild and store timetables for the given students (default: all students)"""
+    with Database.get_session() as session:
+        if student_ids is None:
+            student_ids = [reg_no for (reg_no,) in session.query(User.reg_no).filter(User.role == UserRole.student)]
+        student_ids = list(student_ids)
+
+        for start in range(0, len(student_ids), chunk_size):
+            chunk = student_ids[start:start + chunk_size]
+            _build_and_store(session, chunk)
+            print(f"Rebuilt {start + len(chunk)}/{len(student_ids)} timetables")
+        return len(student_ids)
+
+
+if __name__ == "__main__":
+    rebuild_timetables(sys.argv[1:] or None)
@@ -1,9 +1,18 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 from utils.db import Database
+from utils.face_pool import FacePool
+from utils.metrics import request_id_var, observe
+from utils.admission import QueueFull
+from core.reg_attendance import attendance_writer, ATTENDANCE_WRITE_BEHIND
+from core.notifications import notification_dispatcher
+from utils.mail import smtp_pool
 import uvicorn
-from routers import user_route,admin_route,attendance_route,dashboard_route,od_route
+import time
+import uuid
+from routers import user_route,admin_route,attendance_route,dashboard_route,od_route,metrics_route
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -13,7 +22,23 @@ async def lifespan(app: FastAPI):
     else:
         print("Failed to connect to Database")
         raise RuntimeError("Database connection failed")
+    print("Starting face worker pool.....")
+    if not FacePool.initialize():
+        raise RuntimeError("Face worker pool failed to start")
+    if ATTENDANCE_WRITE_BEHIND:
+        print("Starting attendance write-behind buffer.....")
+        attendance_writer.start()
+    print("Starting notification dispatcher.....")
+    notification_dispatcher.start()
     yield
+    print("Stopping notification dispatcher.....")
+    await notification_dispatcher.stop()
+    smtp_pool.close()
+    if attendance_writer.running:
+        print("Flushing attendance write-behind buffer.....")
+        await attendance_writer.stop()
+    print("Stopping face worker pool.....")
+    FacePool.shutdown()
     print("Disconnecting from Database.....")
     Database._engine.dispose()
     print("Disconnected from Database")
@@ -28,8 +53,31 @@ app.add_middleware(
     allow_credentials=True, 
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        route = request.scope.get("route")
+        observe(f"http {request.method} {route.path if route else request.url.path}", time.perf_counter() - start)
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.exception_handler(QueueFull)
+async def queue_full_handler(request: Request, exc: QueueFull):
+    return JSONResponse(
+        status_code=429,
+        content={"success": False, "message": "Server is busy, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
@@ -39,6 +87,7 @@ app.include_router(admin_route.router, prefix="/admin", tags=["Admin"])
 app.include_router(attendance_route.router, prefix="/attendance", tags=["Attendance"])
 app.include_router(dashboard_route.router, prefix="/dashboard", tags=["Dashboard"])
 app.include_router(od_route.router, prefix="/od", tags=["OD"])
+app.include_router(metrics_route.router, prefix="/metrics", tags=["Metrics"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="debug")
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""Convert users.face from a JSON float array to packed 128 x float32 bytes.
+
+Run once against the live database:
+
+    python -m migrations.0001_face_embeddings_binary
+
+Safe to re-run: it does nothing if the column is already bytea.
+"""
+from sqlalchemy import text
+from utils.db import Database
+from utils.embeddings import encode_embedding
+
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    Database.initialize()
+    with Database._engine.begin() as conn:
+        column_type = conn.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'users' AND column_name = 'face'"
+        )).scalar()
+        if column_type == "bytea":
+            print("users.face is already binary, nothing to do")
+            return
+
+        conn.execute(text("ALTER TABLE users ADD COLUMN face_bin BYTEA"))
+
+        converted = 0
+        last_reg_no = ""
+        while True:
+            rows = conn.execute(
+                text(
+                    "SELECT reg_no, face FROM users WHERE reg_no > :last "
+                    "ORDER BY reg_no LIMIT :limit"
+                ),
+                {"last": last_reg_no, "limit": BATCH_SIZE},
+            ).all()
+            if not rows:
+                break
+            conn.execute(
+                text("UPDATE users SET face_bin = :face WHERE reg_no = :reg_no"),
+                [{"reg_no": reg_no, "face": encode_embedding(face)} for reg_no, face in rows],
+            )
+            converted += len(rows)
+            last_reg_no = rows[-1][0]
+
+        conn.execute(text("ALTER TABLE users DROP COLUMN face"))
+        conn.execute(text("ALTER TABLE users RENAME COLUMN face_bin TO face"))
+        conn.execute(text("ALTER TABLE users ALTER COLUMN face SET NOT NULL"))
+        print(f"Converted {converted} face embeddings to binary")
+
+
+if __name__ == "__main__":
+    upgrade()
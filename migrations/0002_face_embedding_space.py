@@ -0,0 +1,23 @@
+"""Record which model produced each stored face embedding.
+
+Existing rows were all encoded by face_recognition/dlib, so they get the
+'dlib-128' space. Run once:
+
+    python -m migrations.0002_face_embedding_space
+"""
+from sqlalchemy import text
+from utils.db import Database
+
+
+def upgrade():
+    Database.initialize()
+    with Database._engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS face_space VARCHAR(64) "
+            "NOT NULL DEFAULT 'dlib-128'"
+        ))
+        print("users.face_space is in place")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,34 @@
+"""One attendance record per student per session.
+
+The in-memory marked sets (core.session_registry) are per worker, so the
+database has to reject the rare duplicate that slips through between
+workers. Older duplicates are collapsed to the earliest record first. Run
+once:
+
+    python -m migrations.0003_attendance_record_unique
+"""
+from sqlalchemy import text
+from utils.db import Database
+
+
+def upgrade():
+    Database.initialize()
+    with Database._engine.begin() as conn:
+        removed = conn.execute(text(
+            "DELETE FROM attendance_records a USING attendance_records b "
+            "WHERE a.session_id = b.session_id AND a.student_id = b.student_id AND a.id > b.id"
+        )).rowcount
+        print(f"Removed {removed} duplicate attendance records")
+
+        conn.execute(text(
+            "ALTER TABLE attendance_records DROP CONSTRAINT IF EXISTS uq_attendance_session_student"
+        ))
+        conn.execute(text(
+            "ALTER TABLE attendance_records ADD CONSTRAINT uq_attendance_session_student "
+            "UNIQUE (session_id, student_id)"
+        ))
+        print("attendance_records (session_id, student_id) is unique")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,28 @@
+"""Geofences per classroom, and polygon fences for sessions.
+
+Classrooms get an optional default fence (lat/long/radius_meters and/or a
+polygon of [lat, lon] vertices) that new attendance sessions inherit.
+Run once:
+
+    python -m migrations.0004_classroom_fences
+"""
+from sqlalchemy import text
+from utils.db import Database
+
+
+def upgrade():
+    Database.initialize()
+    with Database._engine.begin() as conn:
+        for statement in (
+            "ALTER TABLE classrooms ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION",
+            "ALTER TABLE classrooms ADD COLUMN IF NOT EXISTS long DOUBLE PRECISION",
+            "ALTER TABLE classrooms ADD COLUMN IF NOT EXISTS radius_meters INTEGER",
+            "ALTER TABLE classrooms ADD COLUMN IF NOT EXISTS polygon JSON",
+            "ALTER TABLE attendance_sessions ADD COLUMN IF NOT EXISTS polygon JSON",
+        ):
+            conn.execute(text(statement))
+        print("classroom and session fence columns are in place")
+
+
+if __name__ == "__main__":
+    upgrade()
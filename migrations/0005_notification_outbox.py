@@ -0,0 +1,20 @@
+"""Outbox table for parent notifications (see core.notifications).
+
+Run once:
+
+    python -m migrations.0005_notification_outbox
+"""
+from utils.db import Database
+from models import NotificationOutbox
+
+
+def upgrade():
+    Database.initialize()
+    with Database._engine.begin() as conn:
+        # Creates the notificationstatus enum type and indexes as well.
+        NotificationOutbox.__table__.create(conn, checkfirst=True)
+        print("notification_outbox is in place")
+
+
+if __name__ == "__main__":
+    upgrade()
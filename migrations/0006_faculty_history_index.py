@@ -0,0 +1,21 @@
+"""Index backing the keyset-paginated faculty history
+(core.dashboard.get_faculty_attendance_history). Run once:
+
+    python -m migrations.0006_faculty_history_index
+"""
+from sqlalchemy import text
+from utils.db import Database
+
+
+def upgrade():
+    Database.initialize()
+    with Database._engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_attendance_sessions_faculty_start "
+            "ON attendance_sessions (faculty_id, start_time, id)"
+        ))
+        print("ix_attendance_sessions_faculty_start is in place")
+
+
+if __name__ == "__main__":
+    upgrade()
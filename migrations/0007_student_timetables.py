@@ -0,0 +1,20 @@
+"""Table for the precomputed student timetables (see core.timetable).
+
+Run once; timetables are then built on first read, or all at once with
+`python -m core.timetable`:
+
+    python -m migrations.0007_student_timetables
+"""
+from utils.db import Database
+from models import StudentTimetable
+
+
+def upgrade():
+    Database.initialize()
+    with Database._engine.begin() as conn:
+        StudentTimetable.__table__.create(conn, checkfirst=True)
+        print("student_timetables is in place")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,21 @@
+"""Per-student, per-course attendance counters (see core.attendance_stats).
+
+Run once; this creates the table and fills it from attendance_records:
+
+    python -m migrations.0008_attendance_counters
+"""
+from utils.db import Database
+from models import AttendanceCounter
+from core.attendance_stats import rebuild_counters
+
+
+def upgrade():
+    Database.initialize()
+    with Database._engine.begin() as conn:
+        AttendanceCounter.__table__.create(conn, checkfirst=True)
+        print("attendance_counters is in place")
+    rebuild_counters()
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -1,8 +1,7 @@
 import enum
 from sqlalchemy import (Column,Integer,String,Float,DateTime,
-    ForeignKey,Enum,LargeBinary,Text,Table,func,Boolean,Time,Float)
+    ForeignKey,Enum,LargeBinary,Text,Table,func,Boolean,Time,Float,UniqueConstraint,JSON,Index)
 from sqlalchemy.orm import relationship, declarative_base
-from sqlalchemy.dialects.postgresql import JSON
 
 Base = declarative_base()
 
@@ -22,6 +21,11 @@ class LeaveStatus(enum.Enum):
     approved = "approved"
     rejected = "rejected"
 
+class NotificationStatus(enum.Enum):
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
+
 class DayOfWeek(enum.Enum):
     monday = "monday"
     tuesday = "tuesday"
@@ -53,7 +57,8 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     role = Column(Enum(UserRole),nullable=False)
     pfp = Column(LargeBinary, nullable=True)
-    face = Column(JSON, nullable=False)
+    face = Column(LargeBinary, nullable=False)  # packed float32, see utils.embeddings
+    face_space = Column(String(64), nullable=False, default="dlib-128", server_default="dlib-128")
 
     courses_assigned = relationship(
         "Course",
@@ -121,6 +126,13 @@ class Classroom(Base):
     
     id = Column(Integer, primary_key=True)
     class_number = Column(String(20), unique=True, nullable=False)  
+
+    # Default attendance fence, see core.geofence. polygon is [[lat, lon], ...];
+    # lat/long is its centroid when only a polygon is configured.
+    lat = Column(Float, nullable=True)
+    long = Column(Float, nullable=True)
+    radius_meters = Column(Integer, nullable=True)
+    polygon = Column(JSON, nullable=True)
     
    
     schedules = relationship("ClassSchedule", back_populates="classroom")
@@ -176,6 +188,7 @@ class ClassSchedule(Base):
 
 class AttendanceSession(Base):
     __tablename__ = 'attendance_sessions'
+    __table_args__ = (Index('ix_attendance_sessions_faculty_start', 'faculty_id', 'start_time', 'id'),)
     id = Column(Integer, primary_key=True)
     course_id = Column(Integer, ForeignKey('courses.id'), nullable=False)
     faculty_id = Column(String, ForeignKey('users.reg_no'), nullable=False)  
@@ -184,6 +197,7 @@ class AttendanceSession(Base):
     lat = Column(Float, nullable=False)
     long = Column(Float, nullable=False)
     radius_meters = Column(Integer, default=30, nullable=False)
+    polygon = Column(JSON, nullable=True)  # overrides the circle when set
     is_active = Column(Boolean, server_default="true", nullable=False)
     remarks = Column(Text, nullable=True)
 
@@ -196,6 +210,7 @@ class AttendanceSession(Base):
 
 class AttendanceRecord(Base):
     __tablename__ = 'attendance_records'
+    __table_args__ = (UniqueConstraint('session_id', 'student_id', name='uq_attendance_session_student'),)
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('attendance_sessions.id'), nullable=False)
     student_id = Column(String, ForeignKey('users.reg_no'), nullable=False)  
@@ -223,3 +238,46 @@ class LeaveRequest(Base):
 
     student = relationship("User", foreign_keys=[student_id], back_populates="leave_requests")
     faculty_reviewer = relationship("User", foreign_keys=[reviewed_by_faculty_id], back_populates="reviewed_leave_requests")
+
+
+class NotificationOutbox(Base):
+    """Notifications written in the same transaction as the event that causes
+    them and delivered later by core.notifications"""
+    __tablename__ = 'notification_outbox'
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)  # e.g. "absence"
+    recipient = Column(String(100), nullable=False)
+    student_id = Column(String, ForeignKey('users.reg_no'), nullable=False)
+    session_id = Column(Integer, ForeignKey('attendance_sessions.id'), nullable=True)
+    status = Column(Enum(NotificationStatus), default=NotificationStatus.pending,
+                    server_default="pending", nullable=False, index=True)
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class StudentTimetable(Base):
+    """Serialized weekly timetable per student, maintained by core.timetable.
+
+    Every change bumps version and clears payload; a build is only stored if
+    the version it started from is still current.
+    """
+    __tablename__ = 'student_timetables'
+    student_id = Column(String, ForeignKey('users.reg_no'), primary_key=True)
+    version = Column(Integer, default=0, server_default="0", nullable=False)
+    payload = Column(JSON(none_as_null=True), nullable=True)
+    built_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class AttendanceCounter(Base):
+    """Running attendance totals per student per course, kept in step with
+    attendance_records by core.attendance_stats"""
+    __tablename__ = 'attendance_counters'
+    student_id = Column(String, ForeignKey('users.reg_no'), primary_key=True)
+    course_id = Column(Integer, ForeignKey('courses.id'), primary_key=True)
+    present = Column(Integer, default=0, server_default="0", nullable=False)
+    late = Column(Integer, default=0, server_default="0", nullable=False)
+    absent = Column(Integer, default=0, server_default="0", nullable=False)
+    total = Column(Integer, default=0, server_default="0", nullable=False)
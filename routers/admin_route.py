@@ -1,8 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException
 from core.courses import (create_course,enroll_students_to_course,
-                          assign_faculty_to_course,get_course_info,create_class_schedule)
-from core.admin import create_classroom,create_time_slot
-from typing import List,Optional
+                          assign_faculty_to_course,get_course_info,create_class_schedule,
+                          deactivate_class_schedule)
+from core.admin import create_classroom,create_time_slot,set_classroom_fence
+from core.bulk_import import import_students, read_report, validate_import
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import List,Optional,Tuple
 from pydantic import BaseModel
 from models import DayOfWeek, ClassType
 
@@ -18,6 +25,13 @@ class CreateSchedule(BaseModel):
     section: Optional[str] = None
     notes: Optional[str] = None
 
+class ClassroomFence(BaseModel):
+    class_number: str
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    radius_meters: Optional[int] = None
+    polygon: Optional[List[Tuple[float, float]]] = None  # [lat, lon] vertices
+
 @router.post("/course/create")
 async def course_create(course_name: str, course_code: str,credits: int,department: str):
     return create_course(course_name, course_code,credits,department)
@@ -47,10 +61,59 @@ async def schedule_class(details: CreateSchedule):
         notes=details.notes
     )
 
+@router.post("/course/schedule/{schedule_id}/deactivate")
+async def schedule_deactivate(schedule_id: int):
+    return deactivate_class_schedule(schedule_id)
+
 @router.post("/classroom/create")
 async def classroom_create(class_number: str):
     return create_classroom(class_number)   
 
+@router.post("/classroom/fence")
+async def classroom_fence(details: ClassroomFence):
+    return set_classroom_fence(
+        class_number=details.class_number,
+        lat=details.lat,
+        lon=details.lon,
+        radius_meters=details.radius_meters,
+        polygon=details.polygon
+    )
+
 @router.post("/timeslot/create")
 async def timeslot_create(name: str, start_time: str, end_time: str):
-    return create_time_slot(name, start_time, end_time)
\ No newline at end of file
+    return create_time_slot(name, start_time, end_time)
+
+@router.post("/students/import")
+async def students_import(background_tasks: BackgroundTasks, csv_file: UploadFile = File(...), archive: UploadFile = File(...)):
+    csv_bytes = await csv_file.read()
+    # The archive stays on disk; the import reads one photo at a time.
+    archive_path = await asyncio.to_thread(_spool_archive, archive.file)
+    error = validate_import(csv_bytes, archive_path)
+    if error:
+        os.unlink(archive_path)
+        raise HTTPException(status_code=400, detail=error)
+
+    job_id = hashlib.sha256(csv_bytes).hexdigest()[:16]
+    background_tasks.add_task(_run_import, csv_bytes, archive_path, job_id)
+    return {"success": True, "message": "Import started", "job_id": job_id}
+
+@router.get("/students/import/{job_id}")
+async def students_import_report(job_id: str):
+    rows = read_report(job_id)
+    summary = {"created": 0, "skipped": 0, "failed": 0}
+    for row in rows:
+        summary[row["status"]] += 1
+    return {"job_id": job_id, "processed": len(rows), **summary, "rows": rows}
+
+
+def _spool_archive(source) -> str:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as temp_file:
+        shutil.copyfileobj(source, temp_file)
+    return temp_file.name
+
+
+def _run_import(csv_bytes: bytes, archive_path: str, job_id: str):
+    try:
+        import_students(csv_bytes, archive_path, job_id)
+    finally:
+        os.unlink(archive_path)
@@ -1,7 +1,7 @@
-from pydantic import BaseModel,Base64Bytes
-from fastapi import APIRouter
+from pydantic import BaseModel,Base64Bytes,field_validator
+from fastapi import APIRouter, UploadFile, File, Form
 from core.attendance import create_attendance_session
-from core.reg_attendance import register_attendance
+from core.reg_attendance import register_attendance, register_group_attendance
 from core.attendance import get_attendance_summary, end_attendance_session
 from fastapi import  HTTPException
 from fastapi.responses import FileResponse
@@ -11,6 +11,9 @@ import os
 import tempfile
 from utils.db import Database
 from fastapi import BackgroundTasks
+from utils.metrics import stage
+from utils.uploads import read_upload, check_upload_size, MAX_CHIP_BYTES
+from typing import List, Tuple, Optional
 from models import (
     AttendanceSession, AttendanceRecord, User, Course, 
     StudentCourseEnrollment, AttendanceStatus
@@ -20,9 +23,10 @@ router = APIRouter()
 
 class AttendanceSessionCreate(BaseModel):
     faculty_id: str
-    lat: float
-    lon: float
-    radius_meters: int
+    # Omit lat/lon to use the classroom's configured fence
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    radius_meters: Optional[int] = None
     remarks: str = None
 
 class RegisterAttendance(BaseModel):
@@ -31,6 +35,30 @@ class RegisterAttendance(BaseModel):
     lat: float
     lon: float
 
+    @field_validator("face", mode="wrap")
+    @classmethod
+    def _timed_decode(cls, value, handler):
+        # Reported as its own stage; malformed base64 still fails with 422.
+        with stage("attendance.base64_decode"):
+            return handler(value)
+
+class ChipLandmarks(BaseModel):
+    # [x, y] in chip pixels; left_eye is the eye with the smaller x
+    left_eye: Tuple[float, float]
+    right_eye: Tuple[float, float]
+    nose: Tuple[float, float]
+
+class RegisterAttendanceChip(BaseModel):
+    student_id: str
+    chip: Base64Bytes
+    landmarks: ChipLandmarks
+    lat: float
+    lon: float
+
+class RegisterGroupAttendance(BaseModel):
+    faculty_id: str
+    photos: List[Base64Bytes]
+
 @router.post("/session/create")
 async def create_session(details: AttendanceSessionCreate):
     return create_attendance_session(
@@ -43,13 +71,44 @@ async def create_session(details: AttendanceSessionCreate):
 
 @router.post("/student/register")
 async def reg_attendance(details: RegisterAttendance):
-    return register_attendance(
+    return await register_attendance(
         student_id=details.student_id,
         face_image_bytes=details.face,
         student_latitude=details.lat,
         student_longitude=details.lon
     )
 
+@router.post("/student/register/upload")
+async def reg_attendance_upload(
+    student_id: str = Form(...),
+    lat: float = Form(...),
+    lon: float = Form(...),
+    face: UploadFile = File(...)
+):
+    return await register_attendance(
+        student_id=student_id,
+        face_image_bytes=await read_upload(face),
+        student_latitude=lat,
+        student_longitude=lon
+    )
+
+@router.post("/student/register/chip")
+async def reg_attendance_chip(details: RegisterAttendanceChip):
+    return await register_attendance(
+        student_id=details.student_id,
+        face_image_bytes=check_upload_size(details.chip, "Face chip", MAX_CHIP_BYTES),
+        student_latitude=details.lat,
+        student_longitude=details.lon,
+        chip_landmarks=details.landmarks.model_dump()
+    )
+
+@router.post("/session/group/register")
+async def reg_group_attendance(details: RegisterGroupAttendance):
+    return await register_group_attendance(
+        faculty_id=details.faculty_id,
+        photos=[check_upload_size(photo, "Group photo") for photo in details.photos]
+    )
+
 @router.get("/session/summary")
 async def get_session_summary():
     return get_attendance_summary()
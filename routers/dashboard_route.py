@@ -1,5 +1,9 @@
-from fastapi import APIRouter
-from core.dashboard import get_student_timetable,get_faculty_attendance_history
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from core.dashboard import (get_student_timetable,get_faculty_attendance_history,
+                            HISTORY_PAGE_SIZE,HISTORY_MAX_PAGE_SIZE)
+from core.attendance_stats import get_student_attendance_summary
 
 router =  APIRouter()
 
@@ -7,6 +11,25 @@ router =  APIRouter()
 async def fetch_timetable(student_reg_no: str):           
     return get_student_timetable(student_reg_no)
 
+@router.get("/attendance/{student_reg_no}")
+async def fetch_attendance_summary(student_reg_no: str, course_id: Optional[int] = None):
+    return get_student_attendance_summary(student_reg_no, course_id)
+
 @router.get("/faculty/{faculty_id}")
-async def fetch_faculty_history(faculty_id: str):   
-    return get_faculty_attendance_history(faculty_id)
\ No newline at end of file
+async def fetch_faculty_history(
+    faculty_id: str,
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    # The body stays a plain list; the cursor for the next page (older
+    # sessions) comes back in X-Next-Cursor and is passed as ?before=.
+    try:
+        history, next_cursor = get_faculty_attendance_history(faculty_id, limit, before, start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return history
@@ -0,0 +1,8 @@
+from fastapi import APIRouter
+from utils.metrics import snapshot
+
+router = APIRouter()
+
+@router.get("/")
+async def get_metrics():
+    return snapshot()
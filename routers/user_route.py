@@ -1,5 +1,9 @@
-from fastapi import APIRouter
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form
+from typing import Optional
 from core.auth import register, Register,login
+from models import UserRole
+from utils.uploads import read_upload
 
 router = APIRouter()
 
@@ -7,6 +11,29 @@ router = APIRouter()
 async def reg_user(details: Register):
     return register(details)
 
+@router.post("/register/upload")
+async def reg_user_upload(
+    reg_no: str = Form(...),
+    name: str = Form(...),
+    password: str = Form(...),
+    parent_email: str = Form(...),
+    role: UserRole = Form(...),
+    face: UploadFile = File(...),
+    pfp: Optional[UploadFile] = File(None)
+):
+    # Images arrive as raw bytes, so skip the Base64Bytes validation of the JSON model.
+    details = Register.model_construct(
+        reg_no=reg_no,
+        name=name,
+        password=password,
+        parent_email=parent_email,
+        role=role,
+        face=await read_upload(face),
+        pfp=await read_upload(pfp) if pfp else None
+    )
+    # Full-resolution detection, encoding and bcrypt must not block the event loop.
+    return await asyncio.to_thread(register, details)
+
 @router.get("/login")
 async def login_user(reg_no: str, password: str):
     return login(reg_no, password)
\ No newline at end of file
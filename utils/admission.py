@@ -0,0 +1,68 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from utils.metrics import observe, increment, register_gauge
+
+load_dotenv()
+
+
+class QueueFull(Exception):
+    """Raised when the work queue is at capacity; surfaced as HTTP 429"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} queue is full")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded queue in front of an expensive resource.
+
+    At most max_concurrency callers hold a slot; up to max_queue more wait
+    for one. Anyone beyond that is rejected immediately instead of piling up
+    until their request times out.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, retry_after: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = None
+        register_gauge(f"{name}.active", lambda: self.active)
+        register_gauge(f"{name}.queue_depth", lambda: self.waiting)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            increment(f"{self.name}.rejected")
+            raise QueueFull(self.name, self.retry_after)
+
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        observe(f"{self.name}.queue_wait", time.perf_counter() - start)
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+face_admission = AdmissionController(
+    "face_queue",
+    max_concurrency=int(os.getenv("FACE_MAX_CONCURRENCY", os.getenv("FACE_WORKERS", os.cpu_count() or 1))),
+    max_queue=int(os.getenv("FACE_MAX_QUEUE", 64)),
+    retry_after=int(os.getenv("FACE_RETRY_AFTER", 2)),
+)
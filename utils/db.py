@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
@@ -41,4 +42,13 @@ class Database:
         try:
             yield db
         finally:
-            db.close()
\ No newline at end of file
+            db.close()
+
+
+def insert_for(session, model):
+    """INSERT for the session's dialect, with on_conflict_do_* available.
+
+    SQLite only backs the benchmark harness; everything else is Postgres.
+    """
+    dialect = sqlite if session.get_bind().dialect.name == "sqlite" else postgresql
+    return dialect.insert(model)
@@ -0,0 +1,25 @@
+import numpy as np
+
+EMBEDDING_DIM = 128
+EMBEDDING_DTYPE = np.float32
+_ITEMSIZE = np.dtype(EMBEDDING_DTYPE).itemsize
+
+
+def encode_embedding(encoding) -> bytes:
+    """Pack a face encoding into packed float32 bytes (512 for dlib's 128-d)"""
+    packed = np.asarray(encoding, dtype=EMBEDDING_DTYPE).reshape(-1)
+    if packed.size == 0:
+        raise ValueError("Cannot store an empty face encoding")
+    return packed.tobytes()
+
+
+def decode_embedding_matrix(raws) -> np.ndarray:
+    """Stack same-space embeddings into one contiguous (n, dim) matrix"""
+    raws = list(raws)
+    if not raws:
+        return np.empty((0, EMBEDDING_DIM), dtype=EMBEDDING_DTYPE)
+    size = len(raws[0])
+    for raw in raws:
+        if len(raw) != size or size % _ITEMSIZE:
+            raise ValueError("Stored face embeddings in one space must have the same length")
+    return np.frombuffer(b"".join(raws), dtype=EMBEDDING_DTYPE).reshape(len(raws), size // _ITEMSIZE)
@@ -0,0 +1,59 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from dotenv import load_dotenv
+from utils.metrics import capture_timings, record_timings
+
+load_dotenv()
+
+
+def _init_worker():
+    from core.face import warm_up
+    warm_up()
+
+
+class FacePool:
+    """Process pool for CPU-bound face detection/encoding.
+
+    Workers are spawned (not forked) so they never inherit DB connections,
+    and each one loads the dlib models once at startup.
+    """
+    _executor = None
+
+    @classmethod
+    def initialize(cls):
+        try:
+            workers = int(os.getenv("FACE_WORKERS", os.cpu_count() or 1))
+            cls._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            return True
+        except Exception as e:
+            print(f"Error initializing face worker pool: {e}")
+            return False
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=True, cancel_futures=True)
+            cls._executor = None
+
+    @classmethod
+    async def submit(cls, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in a face worker and await the result.
+
+        Stage timings recorded inside the worker are replayed into this
+        process's metrics under the current request ID.
+        """
+        if cls._executor is None:
+            cls.initialize()
+        loop = asyncio.get_running_loop()
+        result, timings = await loop.run_in_executor(
+            cls._executor, partial(capture_timings, fn, *args, **kwargs)
+        )
+        record_timings(timings)
+        return result
@@ -0,0 +1,74 @@
+import mmap
+import os
+import tempfile
+import zlib
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: bumps still change the value, just without a lock
+    fcntl = None
+
+load_dotenv()
+
+SESSION_VERSION_FILE = os.getenv(
+    "SESSION_VERSION_FILE", os.path.join(tempfile.gettempdir(), "monitor-session-versions")
+)
+SLOTS = 64
+GLOBAL_SLOT = 0
+
+
+class VersionBoard:
+    """Shared version counters in a memory-mapped file.
+
+    Every worker process on the host maps the same file. Writers bump a
+    slot; readers compare it with the value they last saw, which is a plain
+    memory read with no syscall. Slot 0 is the global slot; the rest are
+    hashed buckets for finer-grained keys.
+    """
+
+    def __init__(self, path: str = SESSION_VERSION_FILE, slots: int = SLOTS):
+        self.slots = slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = slots * 8
+        self._lock()
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+        finally:
+            self._unlock()
+        self._map = mmap.mmap(self._fd, size)
+        self._view = memoryview(self._map).cast("Q")
+
+    def _lock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def slot_for(self, key) -> int:
+        """Bucket for a key; stable across processes (unlike hash() on str)"""
+        return 1 + zlib.crc32(str(key).encode()) % (self.slots - 1)
+
+    def read(self, slot: int = GLOBAL_SLOT) -> int:
+        return self._view[slot]
+
+    def bump(self, slot: int = GLOBAL_SLOT) -> int:
+        self._lock()
+        try:
+            self._view[slot] = (self._view[slot] + 1) % 2**64
+            return self._view[slot]
+        finally:
+            self._unlock()
+
+
+_boards = {}
+
+
+def get_board(path: str = SESSION_VERSION_FILE) -> VersionBoard:
+    """Process-wide board for a path, opened on first use"""
+    if path not in _boards:
+        _boards[path] = VersionBoard(path)
+    return _boards[path]
@@ -1,28 +1,168 @@
 import smtplib
 import ssl
+import threading
+import time
+from collections import deque
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
 import os
+from utils.metrics import increment, observe, register_gauge
 
 load_dotenv()
 
-def send_email(student_name: str, recipient_email: str):
-  
+# SMTP_SSL=0 speaks plain SMTP, e.g. to a local stand-in such as
+# `python -m aiosmtpd -n -l localhost:1025`; login is skipped without a password.
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 465))
+SMTP_SSL = os.getenv("SMTP_SSL", "1") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))
+SMTP_RATE_PER_SEC = float(os.getenv("SMTP_RATE_PER_SEC", 5))  # 0 disables the limit
+SMTP_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MESSAGES_PER_CONNECTION", 100))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", 60))
+
+
+def _connection_lost(error: Exception) -> bool:
+    """True if the connection is unusable. Other SMTP errors (e.g. a refused
+    recipient) are the message's fault and the connection is kept. Note that
+    SMTPException is itself an OSError subclass."""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPPool:
+    """A few authenticated SMTP connections shared by every sender.
+
+    At most `size` messages are in flight at once and sends are spaced to
+    `rate` per second. Connections are reused until they have carried
+    `messages_per_connection` messages or sat idle for `idle_seconds`; a
+    send that finds its connection dropped reconnects and retries once.
+    """
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, use_ssl: bool = SMTP_SSL,
+                 username: str = None, password: str = None, size: int = SMTP_POOL_SIZE,
+                 rate: float = SMTP_RATE_PER_SEC, messages_per_connection: int = SMTP_MESSAGES_PER_CONNECTION,
+                 idle_seconds: float = SMTP_IDLE_SECONDS, timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username if username is not None else os.getenv("sender_email")
+        self.password = password if password is not None else os.getenv("sender_password")
+        self.size = size
+        self.rate = rate
+        self.messages_per_connection = messages_per_connection
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = deque()  # (server, messages_sent, last_used)
+        self._next_send = 0.0
+        self.connections_opened = 0
+
+    def _connect(self):
+        start = time.perf_counter()
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, context=ssl.create_default_context(), timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        observe("smtp.connect", time.perf_counter() - start)
+        increment("smtp.connections_opened")
+        with self._lock:
+            self.connections_opened += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _checkout(self):
+        stale, found = [], None
+        with self._lock:
+            while self._idle:
+                server, sent, last_used = self._idle.pop()
+                if time.monotonic() - last_used < self.idle_seconds:
+                    found = (server, sent)
+                    break
+                stale.append(server)
+        for server in stale:
+            self._close(server)
+        return found or (self._connect(), 0)
+
+    def _checkin(self, server, sent: int):
+        if sent >= self.messages_per_connection:
+            self._close(server)
+            return
+        with self._lock:
+            self._idle.append((server, sent, time.monotonic()))
+
+    def _throttle(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_send)
+            self._next_send = send_at + 1 / self.rate
+        if send_at > now:
+            time.sleep(send_at - now)
+
+    def send(self, sender: str, recipient: str, message: str):
+        with self._slots:
+            self._throttle()
+            start = time.perf_counter()
+            server, sent = self._checkout()
+            try:
+                try:
+                    server.sendmail(sender, recipient, message)
+                except Exception as e:
+                    if not _connection_lost(e):
+                        raise
+                    # Dropped by the server since last use: one fresh attempt.
+                    self._close(server)
+                    increment("smtp.reconnects")
+                    server, sent = self._connect(), 0
+                    server.sendmail(sender, recipient, message)
+            except Exception as e:
+                if _connection_lost(e) or not isinstance(e, smtplib.SMTPException):
+                    self._close(server)
+                    raise
+                try:
+                    server.rset()
+                except Exception:
+                    self._close(server)
+                    raise e
+                self._checkin(server, sent + 1)
+                raise
+            self._checkin(server, sent + 1)
+            observe("smtp.send", time.perf_counter() - start)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for server, _, _ in idle:
+            self._close(server)
+
+
+smtp_pool = SMTPPool()
+register_gauge("smtp.idle_connections", lambda: len(smtp_pool._idle))
+
+
+def send_message(recipient_email: str, subject: str, body: str):
+    """Send one plain-text message; raises smtplib/OS errors to the caller"""
     sender_email = os.getenv("sender_email")
-    sender_password = os.getenv("sender_password")
-    
-    
-    subject = f"Attendance Notification for {student_name}"
-    body = f"Dear Parent,\n{student_name} was absent on 16/09/25 for Period 8\n\nBest regards,\nSRMIST"
     message = MIMEText(body)
     message["From"] = sender_email
     message["To"] = recipient_email
     message["Subject"] = subject
+    smtp_pool.send(sender_email, recipient_email, message.as_string())
 
-
-    context = ssl.create_default_context()
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-        server.login(sender_email, sender_password)
-        server.sendmail(sender_email, recipient_email, message.as_string())
-        print(f"✅ Email sent to {student_name} ({recipient_email})!")
-    
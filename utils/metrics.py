@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_LOG = os.getenv("METRICS_LOG", "0") == "1"
+
+# Upper bounds in milliseconds; the last bucket catches everything above.
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+request_id_var = ContextVar("request_id", default=None)
+_captured = ContextVar("captured_timings", default=None)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, cheap enough to update on every request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                break
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float):
+        """Upper bucket bound containing the q-th observation"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= target:
+                return self.max_ms if bound == float("inf") else bound
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+                "max_ms": round(self.max_ms, 3),
+                "p50_ms": self.quantile(0.50),
+                "p95_ms": self.quantile(0.95),
+                "p99_ms": self.quantile(0.99),
+                "buckets": {
+                    ("inf" if bound == float("inf") else str(bound)): count
+                    for bound, count in zip(BUCKETS_MS, self.counts)
+                },
+            }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def observe(name: str, seconds: float):
+    """Record one timing for a named stage"""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    ms = seconds * 1000
+    histogram.observe(ms)
+    if METRICS_LOG:
+        print(json.dumps({"request_id": request_id_var.get(), "stage": name, "ms": round(ms, 3)}))
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as one pipeline stage.
+
+    Inside a worker process (see capture_timings) the timing is buffered
+    and shipped back to the parent instead of being recorded locally.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        captured = _captured.get()
+        if captured is not None:
+            captured.append((name, elapsed))
+        else:
+            observe(name, elapsed)
+
+
+def capture_timings(fn, *args, **kwargs):
+    """Run fn and return (result, [(stage, seconds), ...]) for replay elsewhere"""
+    captured = []
+    token = _captured.set(captured)
+    try:
+        return fn(*args, **kwargs), captured
+    finally:
+        _captured.reset(token)
+
+
+def increment(name: str, amount: int = 1):
+    with _histograms_lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def register_gauge(name: str, fn):
+    """Report fn() under name every time metrics are read"""
+    _gauges[name] = fn
+
+
+def record_timings(timings):
+    for name, seconds in timings:
+        observe(name, seconds)
+
+
+def snapshot() -> dict:
+    with _histograms_lock:
+        items = list(_histograms.items())
+        counters = dict(_counters)
+    return {
+        "histograms": {name: histogram.snapshot() for name, histogram in sorted(items)},
+        "counters": dict(sorted(counters.items())),
+        "gauges": {name: fn() for name, fn in sorted(_gauges.items())},
+    }
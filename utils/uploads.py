@@ -0,0 +1,40 @@
+import os
+from fastapi import HTTPException, UploadFile, status
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 5 * 1024 * 1024))
+# A client-aligned face chip is at most FACE_CHIP_MAX px square.
+MAX_CHIP_BYTES = int(os.getenv("MAX_CHIP_BYTES", 512 * 1024))
+
+
+def _too_large(name: str, limit: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"{name} exceeds {limit} bytes",
+    )
+
+
+def check_upload_size(data: bytes, name: str = "Upload", limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Same 413 cap for a payload that arrived inline (e.g. base64 in JSON)"""
+    if len(data) > limit:
+        raise _too_large(name, limit)
+    return data
+
+
+async def read_upload(upload: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an uploaded file, failing with 413 if it is over limit.
+
+    Starlette has already spooled the whole multipart body by the time a
+    handler runs, so this bounds what reaches decoding, not what the
+    server receives. Returns the raw bytes as-is (no base64, no JSON)
+    ready for cv2/PIL.
+    """
+    if upload.size is not None and upload.size > limit:
+        raise _too_large(upload.filename or "Upload", limit)
+
+    data = await upload.read(limit + 1)
+    if len(data) > limit:
+        raise _too_large(upload.filename or "Upload", limit)
+    return data
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from utils.metrics import observe, increment, register_gauge
+
+
+class WriteBehindBuffer:
+    """Coalesces concurrent writes into batches.
+
+    Callers await submit(item); items collect until max_batch are waiting or
+    max_delay seconds have passed since the first one, then flush_fn(items)
+    runs once in a thread and must return one result per item, in order.
+    Each caller gets its own item's result back only after the batch has
+    been committed, so a response never claims a write that isn't durable.
+    """
+
+    def __init__(self, name: str, flush_fn, max_batch: int, max_delay: float):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = None
+        self._task = None
+        register_gauge(f"{name}.pending", lambda: self._queue.qsize() if self._queue else 0)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush whatever is buffered, then stop"""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        await self._queue.put(None)
+        await task
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._flush(batch)
+
+        # Anything submitted while stopping still gets written.
+        leftovers = []
+        while not self._queue.empty():
+            entry = self._queue.get_nowait()
+            if entry is not None:
+                leftovers.append(entry)
+        if leftovers:
+            await self._flush(leftovers)
+
+    async def _flush(self, batch):
+        items = [item for item, _ in batch]
+        start = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self.flush_fn, items)
+        except Exception as e:
+            increment(f"{self.name}.flush_failed")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        observe(f"{self.name}.flush", time.perf_counter() - start)
+        increment(f"{self.name}.flushes")
+        increment(f"{self.name}.items", len(items))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)